@@ -394,7 +394,7 @@ function AIHealthAssistant({ navigation }) {
                     {pred.disease || pred.text || 'Unknown Disease'}
                   </Text>
                   <Text style={styles.confidence}>
-                    {pred.confidence ? `${pred.confidence.toFixed(1)}% confidence` : ''}
+                    {pred.confidence ? `${(pred.confidence * 100).toFixed(1)}% confidence` : ''}
                   </Text>
                 </View>
               ))}
@@ -200,7 +200,7 @@ export default function AIHealthAssistant({ navigation }) {
                   {pred.disease || pred.text || 'Unknown Disease'}
                 </Text>
                 <Text style={styles.confidence}>
-                  {pred.confidence ? `${pred.confidence.toFixed(1)}% confidence` : ''}
+                  {pred.confidence ? `${(pred.confidence * 100).toFixed(1)}% confidence` : ''}
                 </Text>
               </View>
             ))}
@@ -209,7 +209,7 @@ export default function AIHealthAssistant({ navigation }) {
               <View style={styles.topPrediction}>
                 <Text style={styles.sectionTitle}>Top Prediction</Text>
                 <Text style={styles.topPredictionText}>
-                  {analysis.top_prediction} ({analysis.confidence?.toFixed(1)}% confidence)
+                  {analysis.top_prediction} ({((analysis.confidence ?? 0) * 100).toFixed(1)}% confidence)
                 </Text>
               </View>
             )}
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from typing import Optional
+import hmac
+import os
+
+from fastapi import Header, HTTPException
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Dependency guarding /admin endpoints with the ADMIN_TOKEN shared secret"""
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
@@ -1,7 +1,10 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from pydantic import BaseModel, Field
 from typing import List, Optional
+import asyncio
 
+from .admin import require_admin
+from .services.compiled import compile_mode
 from .services.infer import InferenceService
 
 
@@ -24,6 +27,13 @@ class AnalyzeResponse(BaseModel):
 app = FastAPI(title="Symptom Checker API", version="0.2.0")
 
 
+@app.on_event("startup")
+async def _load_compiled_model():
+    """COMPILE_MODE compiles the embedder's length buckets when it loads: do that before serving"""
+    if compile_mode() != "off":
+        await asyncio.to_thread(InferenceService.get_registry)
+
+
 @app.get("/")
 async def root():
     return {"status": "ok", "service": "symptom-checker"}
@@ -31,10 +41,15 @@ async def root():
 
 @app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze(req: AnalyzeRequest):
-    service = InferenceService.get_instance()
-    preds = service.predict_with_confidence(req.symptoms, top_k=3)
-    next_step = service.map_next_step(req.symptoms, age=req.age, gender=req.gender)
+    with InferenceService.get_registry().lease() as service:
+        preds = service.predict_with_confidence(req.symptoms, top_k=3)
+        next_step = service.map_next_step(req.symptoms, age=req.age, gender=req.gender)
     return AnalyzeResponse(
         predictions=[Prediction(condition=label, confidence=conf) for label, conf in preds],
         next_step=next_step,
     )
+
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def admin_models():
+    return InferenceService.get_registry().status()
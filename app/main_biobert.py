@@ -1,11 +1,23 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import Depends, FastAPI, File, UploadFile, Form, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import asyncio
+import json
+import os
 
+from .admin import require_admin
+from .responses import MSGPACK_TYPES, encode_response
+from .services.autotune import maybe_autotune_on_startup, tuned_batch
 from .services.biobert_infer import BioBERTInferenceService
+from .services.compiled import compile_mode
+from .services.deadline import Deadline, DeadlineExceeded, request_deadline, wasted_work
 from .services.voice_analysis import VoiceAnalysisService
+from .services.singleflight import SingleFlight, content_key, text_key
+from .services.scheduler import HIGH, LOW, InferenceScheduler, Overloaded
+from .services.profiler import Profiler, ProfilingMiddleware
+from .uploads import UploadLimitMiddleware, close_all, download_audio, upload_file, upload_files
 
 
 class AnalyzeRequest(BaseModel):
@@ -23,10 +35,18 @@ class Prediction(BaseModel):
 class AnalyzeResponse(BaseModel):
     predictions: List[Prediction]
     next_step: str
+    degraded: bool = Field(False, description="True when overload shed model inference and only triage rules ran")
 
 
 app = FastAPI(title="BioBERT Symptom Checker API", version="0.3.0")
 
+# Per-request deadline in ms (X-Request-Timeout-Ms header, default REQUEST_DEADLINE_MS)
+_TIMEOUT_HEADER = Header(None, ge=1, description="Give up on this request after N ms (default REQUEST_DEADLINE_MS)")
+
+# 413 for voice uploads over UPLOAD_MAX_REQUEST_MB, checked before the body is buffered
+# (added before CORS so rejections still carry CORS headers)
+app.add_middleware(UploadLimitMiddleware)
+
 # Add CORS middleware for frontend integration
 app.add_middleware(
     CORSMiddleware,
@@ -36,34 +56,95 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# On-demand profiling (started via /admin/profile); a single attribute check per request when idle
+_profiler = Profiler()
+app.add_middleware(ProfilingMiddleware, profiler=_profiler)
+
+# Identical concurrent requests (mobile retries, several staff submitting the same case)
+# share one in-flight inference
+_analyze_flight = SingleFlight()
+_voice_flight = SingleFlight()
+
+# Red-flag cases jump the inference queue; under overload the rest may be answered rules-only
+def _predict_batch(texts: List[str]):
+    # Lease the active model version so a hot-swap mid-batch cannot free it
+    with BioBERTInferenceService.get_registry().lease() as service:
+        return service.predict_dicts(texts, top_k=3)
+
+
+# AUTOTUNE_ON_STARTUP=1 benchmarks thread/batch settings once per host before serving
+maybe_autotune_on_startup("biobert")
+_scheduler = InferenceScheduler(
+    _predict_batch, max_batch=int(os.environ.get("INFERENCE_MAX_BATCH", "0")) or tuned_batch("biobert")
+)
+
+
+@app.on_event("startup")
+async def _load_compiled_model():
+    """COMPILE_MODE compiles every length bucket when the model loads: do that before serving, not on the first request"""
+    if compile_mode() != "off":
+        await asyncio.to_thread(BioBERTInferenceService.get_registry)
+
 
 @app.get("/")
 async def root():
     return {"status": "ok", "service": "biobert-symptom-checker"}
 
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze(req: AnalyzeRequest):
+@app.post(
+    "/analyze",
+    response_model=AnalyzeResponse,
+    responses={200: {"content": {MSGPACK_TYPES[0]: {}}}},
+)
+async def analyze(
+    req: AnalyzeRequest,
+    request: Request,
+    accept: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[int] = _TIMEOUT_HEADER,
+):
+    """
+    Classify free-text symptoms
+    
+    The response is encoded directly (AnalyzeResponse documents its shape); send
+    `Accept: application/msgpack` for a compact binary body.
+    """
+    key = text_key(req.symptoms, req.age, (req.gender or "").lower())
+    async with request_deadline(request, x_request_timeout_ms) as deadline:
+        try:
+            payload = await _analyze_flight.do(
+                key, lambda: _analyze_text(req.symptoms, req.age, req.gender, deadline), deadline
+            )
+        except DeadlineExceeded as e:
+            raise HTTPException(status_code=504, detail=str(e))
+    return encode_response(payload, accept)
+
+
+async def _analyze_text(
+    symptoms: str, age: Optional[int], gender: Optional[str], deadline: Optional[Deadline] = None
+) -> dict:
     service = BioBERTInferenceService.get_instance()
-    preds = service.predict_with_confidence(req.symptoms, top_k=3)
-    next_step = service.map_next_step(req.symptoms, age=req.age, gender=req.gender)
+    # Rules pass first: it is cheap and decides the queue lane
+    next_step = service.map_next_step(symptoms, age=age, gender=gender)
+    priority = HIGH if next_step == "Emergency" else LOW
+    try:
+        preds = await _scheduler.submit(symptoms, priority, deadline)
+    except Overloaded:
+        return {"predictions": [], "next_step": next_step, "degraded": True}
     
-    return AnalyzeResponse(
-        predictions=[
-            Prediction(disease=disease, confidence=confidence, treatment=treatment) 
-            for disease, confidence, treatment in preds
-        ],
-        next_step=next_step,
-    )
+    # Prediction dicts come straight from the model's label table; no per-field validation
+    return {"predictions": preds, "next_step": next_step, "degraded": False}
 
 
 @app.post("/analyze-voice")
 async def analyze_voice(
+    request: Request,
     audio: Optional[UploadFile] = File(None, description="Audio file (WAV, MP3, etc.)"),
     audio_url: Optional[str] = Form(None, description="Supabase URL of audio file"),
     language: str = Form(default="en", description="Language code (en/hi)"),
     age: Optional[int] = Form(None, ge=0, le=120, description="User age"),
-    gender: Optional[str] = Form(None, description="User gender")
+    gender: Optional[str] = Form(None, description="User gender"),
+    speculative: bool = Form(default=False, description="Use draft-model speculative decoding for Whisper"),
+    x_request_timeout_ms: Optional[int] = _TIMEOUT_HEADER,
 ):
     """
     Analyze symptoms from voice input
@@ -73,60 +154,80 @@ async def analyze_voice(
     - **language**: Language code ("en" for English, "hi" for Hindi)
     - **age**: Optional user age
     - **gender**: Optional user gender
+    - **speculative**: Use speculative (draft-model assisted) Whisper decoding when a draft model is configured
+    
+    Work is abandoned (504) once the request deadline passes or the client disconnects.
     """
+    async with request_deadline(request, x_request_timeout_ms) as deadline:
+        return await _analyze_voice(audio, audio_url, language, age, gender, speculative, deadline)
+
+
+async def _analyze_voice(
+    audio: Optional[UploadFile],
+    audio_url: Optional[str],
+    language: str,
+    age: Optional[int],
+    gender: Optional[str],
+    speculative: bool,
+    deadline: Deadline,
+):
+    downloaded = None
     try:
         audio_data = None
         
         if audio_url:
-            # Download from Supabase URL
-            import requests
+            # Stream from the Supabase URL into a spooled temp file (bounded memory)
+            deadline.check("audio download")
             try:
-                response = requests.get(audio_url, timeout=30)
-                response.raise_for_status()
-                audio_data = response.content
-                print(f"Downloaded audio from Supabase: {len(audio_data)} bytes")
+                downloaded = await asyncio.to_thread(download_audio, audio_url, min(30.0, deadline.remaining()))
+                audio_data = downloaded
+            except HTTPException:
+                raise
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Failed to download audio from URL: {str(e)}")
         elif audio:
-            # Read uploaded file
-            if not audio.content_type.startswith('audio/'):
-                raise HTTPException(status_code=400, detail="File must be an audio file")
-            
-            audio_data = await audio.read()
-            if len(audio_data) == 0:
-                raise HTTPException(status_code=400, detail="Empty audio file")
+            # Decode straight from the upload's spooled file
+            audio_data = upload_file(audio)
         else:
             raise HTTPException(status_code=400, detail="Either audio file or audio_url must be provided")
         
-        # Prepare user info
-        user_info = {}
-        if age is not None:
-            user_info["age"] = age
-        if gender is not None:
-            user_info["gender"] = gender
+        user_info = _user_info(age, gender)
         
         # Analyze voice
         voice_service = VoiceAnalysisService.get_instance()
-        result = await voice_service.analyze_voice_symptoms(
+        # Hashing up to UPLOAD_MAX_FILE_MB of audio is blocking I/O; keep it off the event loop
+        key = await asyncio.to_thread(content_key, audio_data, language, age, (gender or "").lower(), speculative)
+        result = await _voice_flight.do(key, lambda: voice_service.analyze_voice_symptoms(
             audio_data, 
             language=language, 
-            user_info=user_info
-        )
+            user_info=user_info,
+            speculative=speculative,
+            deadline=deadline
+        ), deadline)
         
+        if result.get("deadline_exceeded"):
+            raise HTTPException(status_code=504, detail=result["error"])
         return result
         
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Voice analysis failed: {str(e)}")
+    finally:
+        close_all([downloaded] if downloaded is not None else None)
 
 
 @app.post("/analyze-voice-batch")
 async def analyze_voice_batch(
+    request: Request,
     audio_files: List[UploadFile] = File(..., description="Multiple audio files"),
     language: str = Form(default="en", description="Language code (en/hi)"),
     age: Optional[int] = Form(None, ge=0, le=120, description="User age"),
-    gender: Optional[str] = Form(None, description="User gender")
+    gender: Optional[str] = Form(None, description="User gender"),
+    speculative: bool = Form(default=False, description="Use draft-model speculative decoding for Whisper"),
+    x_request_timeout_ms: Optional[int] = _TIMEOUT_HEADER,
 ):
     """
     Analyze symptoms from multiple voice inputs
@@ -135,33 +236,23 @@ async def analyze_voice_batch(
     - **language**: Language code ("en" for English, "hi" for Hindi)
     - **age**: Optional user age
     - **gender**: Optional user gender
+    - **speculative**: Use speculative (draft-model assisted) Whisper decoding when a draft model is configured
+    
+    Clips not finished by the request deadline come back with `"deadline_exceeded": true`.
     """
     try:
         if len(audio_files) > 10:  # Limit batch size
             raise HTTPException(status_code=400, detail="Maximum 10 files per batch")
         
-        # Validate and read audio files
-        audio_data_list = []
-        for audio in audio_files:
-            if not audio.content_type.startswith('audio/'):
-                raise HTTPException(status_code=400, detail=f"File {audio.filename} must be an audio file")
-            
-            data = await audio.read()
-            if len(data) == 0:
-                raise HTTPException(status_code=400, detail=f"Empty audio file: {audio.filename}")
-            
-            audio_data_list.append(data)
-        
-        # Prepare user info
-        user_info = {}
-        if age is not None:
-            user_info["age"] = age
-        if gender is not None:
-            user_info["gender"] = gender
+        audio_data_list = upload_files(audio_files)
+        user_info = _user_info(age, gender)
         
         # Analyze voices in batch
         voice_service = VoiceAnalysisService.get_instance()
-        results = await voice_service.batch_analyze(audio_data_list, language=language)
+        async with request_deadline(request, x_request_timeout_ms, items=len(audio_data_list)) as deadline:
+            results = await voice_service.batch_analyze(
+                audio_data_list, language=language, user_info=user_info, speculative=speculative, deadline=deadline
+            )
         
         return {
             "success": True,
@@ -177,6 +268,55 @@ async def analyze_voice_batch(
         raise HTTPException(status_code=500, detail=f"Batch voice analysis failed: {str(e)}")
 
 
+@app.post("/analyze-voice-batch/stream")
+async def analyze_voice_batch_stream(
+    audio_files: List[UploadFile] = File(..., description="Multiple audio files"),
+    language: str = Form(default="en", description="Language code (en/hi)"),
+    age: Optional[int] = Form(None, ge=0, le=120, description="User age"),
+    gender: Optional[str] = Form(None, description="User gender"),
+    speculative: bool = Form(default=False, description="Use draft-model speculative decoding for Whisper"),
+    x_request_timeout_ms: Optional[int] = _TIMEOUT_HEADER,
+):
+    """
+    Analyze symptoms from multiple voice inputs, streaming results as each clip completes
+    
+    Responds with newline-delimited JSON; each line carries the clip's `index` in the upload order.
+    If the client disconnects, clips still in the pipeline are abandoned.
+    """
+    if len(audio_files) > 10:  # Limit batch size
+        raise HTTPException(status_code=400, detail="Maximum 10 files per batch")
+    
+    # Detached: the form's files are closed when this function returns, before the stream runs
+    audio_data_list = upload_files(audio_files, detach=True)
+    user_info = _user_info(age, gender)
+    voice_service = VoiceAnalysisService.get_instance()
+    
+    deadline = Deadline.for_request(x_request_timeout_ms, items=len(audio_data_list))
+    
+    async def ndjson():
+        results = voice_service.stream_batch(
+            audio_data_list, language=language, user_info=user_info, speculative=speculative, deadline=deadline
+        )
+        try:
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Runs on client disconnect too, so in-flight clips are abandoned right away
+            await results.aclose()
+            close_all(audio_data_list)
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+def _user_info(age: Optional[int], gender: Optional[str]) -> dict:
+    user_info = {}
+    if age is not None:
+        user_info["age"] = age
+    if gender is not None:
+        user_info["gender"] = gender
+    return user_info
+
+
 @app.get("/health")
 async def health():
     try:
@@ -210,6 +350,78 @@ async def health():
         return {"status": "unhealthy", "error": str(e)}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Request coalescing, inference queue, deadline (wasted work), segment cache and compiled-mode counters"""
+    service = BioBERTInferenceService.get_instance()
+    return {
+        "singleflight": {
+            "analyze": _analyze_flight.stats(),
+            "analyze_voice": _voice_flight.stats(),
+        },
+        "inference_queue": _scheduler.stats(),
+        "deadlines": wasted_work.stats(),
+        "segments": service.segments.stats(),
+        "compiled": service.compiled.stats() if service.compiled is not None else {"mode": "off"},
+    }
+
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def admin_models():
+    """Active model version, load/warmup times and versions still draining in-flight requests"""
+    return BioBERTInferenceService.get_registry().status()
+
+
+@app.post("/admin/models/reload", dependencies=[Depends(require_admin)])
+async def admin_reload_model(version: Optional[str] = None):
+    """Load, warm and swap in a model version (newest or pinned by default) without downtime"""
+    registry = BioBERTInferenceService.get_registry()
+    try:
+        loaded = await asyncio.to_thread(registry.reload, version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+    return {"loaded": loaded, "registry": registry.status()}
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_start_profile(
+    requests: int = Query(50, ge=1, le=1000, description="Stop after this many requests"),
+    seconds: float = Query(60, gt=0, le=600, description="Stop after this many seconds"),
+    sample_ms: float = Query(5, ge=1, le=100, description="Python stack sampling interval"),
+):
+    """Profile the next N requests or T seconds: torch trace, sampled Python stacks, per-request memory"""
+    try:
+        return _profiler.start(requests, seconds, sample_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)])
+async def admin_stop_profile():
+    """End the running profiling session early and write its artifacts"""
+    summary = await _profiler.finish("stopped by admin")
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No profiling session running")
+    return summary
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile_status():
+    """Running session (if any) and recent sessions with downloadable artifacts"""
+    return _profiler.status()
+
+
+@app.get("/admin/profile/{session_id}/{artifact}", dependencies=[Depends(require_admin)])
+async def admin_profile_artifact(session_id: str, artifact: str):
+    """Download torch_trace.json (chrome://tracing, Perfetto), samples.folded (flamegraph) or report.json"""
+    path = _profiler.artifact_path(session_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile artifact not found")
+    return FileResponse(path, filename=f"{session_id}-{artifact}")
+
+
 @app.get("/supported-languages")
 async def get_supported_languages():
     """Get list of supported languages for voice input"""
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+import json
+
+from fastapi.responses import Response
+
+# Optional fast encoders; plain json is used when they are not installed
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def dumps_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    return msgpack is not None and bool(accept) and any(t in accept for t in MSGPACK_TYPES)
+
+
+def encode_response(payload: Any, accept: Optional[str] = None, status_code: int = 200) -> Response:
+    """Encode plain dicts/lists directly, skipping pydantic validation; msgpack if the client accepts it"""
+    if wants_msgpack(accept):
+        body, media_type = msgpack.packb(payload, use_bin_type=True), MSGPACK_TYPES[0]
+    else:
+        body, media_type = dumps_json(payload), "application/json"
+    return Response(body, status_code=status_code, media_type=media_type, headers={"Vary": "Accept"})
@@ -0,0 +1,262 @@
+"""
+Thread-count and batch-size autotuning for CPU inference.
+
+Benchmarks a small grid of torch intra-op threads, inter-op threads and batch sizes on
+synthetic symptom texts and saves the best setting for this host to AUTOTUNE_FILE
+(default models/autotune.json). Services read it on later startups:
+
+- apply_tuned_threads() sets torch threads (TORCH_NUM_THREADS / TORCH_INTEROP_THREADS override)
+- tuned_batch() feeds the inference scheduler's max batch and bulk scoring's batch size
+
+Inter-op threads can only be set once per process, so each inter-op value is measured in
+its own spawned process.
+
+Usage:
+    python -m app.services.autotune --targets biobert
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import random
+import statistics
+import time
+
+logger = logging.getLogger(__name__)
+
+TARGETS = ("biobert", "embedder")
+
+_PHRASES = [
+    "high fever", "dry cough", "severe headache", "pain behind the eyes", "skin rash on my arms",
+    "joint pain", "nausea and vomiting", "loose motions since two days", "chest tightness",
+    "shortness of breath when climbing stairs", "burning sensation while urinating", "itchy red patches",
+    "fatigue and weakness", "loss of appetite", "runny nose and sneezing", "stomach cramps",
+]
+
+_applied = False
+
+
+def config_path() -> str:
+    return os.environ.get(
+        "AUTOTUNE_FILE", os.path.join(os.path.dirname(__file__), "..", "..", "models", "autotune.json")
+    )
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_config() -> Optional[Dict[str, Any]]:
+    """Saved autotune result, or None if missing or tuned on a host with a different core count"""
+    config = _read(config_path())
+    if config is None:
+        return None
+    if config.get("cpu_count") != os.cpu_count():
+        logger.warning(
+            f"Ignoring {config_path()}: tuned for {config.get('cpu_count')} cores, this host has {os.cpu_count()}"
+        )
+        return None
+    return config
+
+
+def apply_tuned_threads() -> None:
+    """Set torch intra/inter-op threads from the environment or the autotune file (once per process)"""
+    global _applied
+    if _applied:
+        return
+    _applied = True
+    import torch
+
+    config = load_config() or {}
+    threads = int(os.environ.get("TORCH_NUM_THREADS") or config.get("threads") or 0)
+    interop = int(os.environ.get("TORCH_INTEROP_THREADS") or config.get("interop_threads") or 0)
+    if threads:
+        torch.set_num_threads(threads)
+    if interop:
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError as e:
+            # Only possible before any inter-op parallel work has run in this process
+            logger.warning(f"Could not set inter-op threads to {interop}: {e}")
+    if threads or interop:
+        logger.info(f"torch threads: intra-op {torch.get_num_threads()}, inter-op {torch.get_num_interop_threads()}")
+
+
+def tuned_batch(target: str = "biobert", key: str = "max_batch") -> Optional[int]:
+    """Tuned batch size for ``target``: ``max_batch`` (within the latency budget) or ``throughput_batch``"""
+    config = load_config()
+    if config is None:
+        return None
+    return config.get("targets", {}).get(target, {}).get(key)
+
+
+def synthetic_texts(n: int, seed: int = 0) -> List[str]:
+    """Symptom descriptions of varied length, roughly like patient free text"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        phrases = rng.sample(_PHRASES, rng.randint(2, 8))
+        texts.append(f"I have {', '.join(phrases[:-1])} and {phrases[-1]} for the last {rng.randint(1, 10)} days")
+    return texts
+
+
+def _default_thread_grid(cores: int) -> List[int]:
+    return sorted({t for t in (1, 2, 4, cores // 2, cores) if 1 <= t <= cores})
+
+
+def _make_runner(target: str) -> Callable[[List[str]], Any]:
+    if target == "biobert":
+        from .biobert_infer import BioBERTInferenceService
+
+        service = BioBERTInferenceService()
+        return lambda texts: service.predict_batch(texts)
+    if target == "embedder":
+        from ..transformers.embedder import PubMedBERTEmbedder
+
+        embedder = PubMedBERTEmbedder()
+        return lambda texts: embedder.embed_texts(texts)
+    raise ValueError(f"Unknown autotune target {target!r}; expected one of {TARGETS}")
+
+
+def _init_child_logging(level: int) -> None:
+    """Spawned children start with logging unconfigured; log grid points at the parent's level"""
+    logging.basicConfig(level=level)
+
+
+def _sweep(target: str, interop: int, thread_grid: List[int], batch_grid: List[int], repeats: int) -> List[Dict]:
+    """Runs in a fresh process so the inter-op thread count can still be set"""
+    import torch
+
+    torch.set_num_interop_threads(interop)
+    run = _make_runner(target)
+    texts = synthetic_texts(max(batch_grid))
+    results = []
+    for threads in thread_grid:
+        torch.set_num_threads(threads)
+        for batch in batch_grid:
+            run(texts[:batch])  # warm up this shape
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run(texts[:batch])
+                times.append(time.perf_counter() - start)
+            batch_s = statistics.median(times)
+            results.append({
+                "threads": threads,
+                "interop_threads": interop,
+                "batch": batch,
+                "batch_ms": round(batch_s * 1000, 2),
+                "texts_per_sec": round(batch / batch_s, 1),
+            })
+            logger.info(f"Autotune grid point: {results[-1]}")
+    return results
+
+
+def autotune(
+    target: str = "biobert",
+    thread_grid: Optional[List[int]] = None,
+    interop_grid: Optional[List[int]] = None,
+    batch_grid: Optional[List[int]] = None,
+    latency_ms: Optional[float] = None,
+    repeats: int = 5,
+    set_threads: bool = True,
+) -> Dict[str, Any]:
+    """
+    Benchmark the grid for ``target`` and save the result to AUTOTUNE_FILE.
+
+    ``max_batch`` is the highest-throughput setting whose batch latency stays within
+    ``latency_ms`` (default: half of INFERENCE_QUEUE_SLO_MS); ``throughput_batch`` ignores
+    the budget and is meant for offline jobs. With ``set_threads`` the winning thread
+    counts become the process-wide defaults read by apply_tuned_threads().
+    """
+    cores = os.cpu_count() or 1
+    thread_grid = thread_grid or _default_thread_grid(cores)
+    interop_grid = interop_grid or [1, 2]
+    batch_grid = sorted(batch_grid or [1, 4, 8, 16, 32])
+    if latency_ms is None:
+        latency_ms = float(os.environ.get("INFERENCE_QUEUE_SLO_MS", "500")) / 2
+
+    results: List[Dict] = []
+    for interop in interop_grid:
+        # spawn: the child must start without an initialized torch runtime
+        with ProcessPoolExecutor(
+            1,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_child_logging,
+            initargs=(logger.getEffectiveLevel(),),
+        ) as pool:
+            results += pool.submit(_sweep, target, interop, thread_grid, batch_grid, repeats).result()
+
+    within = [r for r in results if r["batch_ms"] <= latency_ms] or [min(results, key=lambda r: r["batch_ms"])]
+    best = max(within, key=lambda r: r["texts_per_sec"])
+    fastest = max(results, key=lambda r: r["texts_per_sec"])
+
+    path = config_path()
+    config = _read(path) or {}
+    if config.get("cpu_count") != cores:
+        config = {}
+    config.update({"cpu_count": cores, "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    if set_threads:
+        config.update({"threads": best["threads"], "interop_threads": best["interop_threads"]})
+    config.setdefault("targets", {})[target] = {
+        "latency_ms": latency_ms,
+        "threads": best["threads"],
+        "interop_threads": best["interop_threads"],
+        "max_batch": best["batch"],
+        "throughput_batch": fastest["batch"],
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, path)
+    logger.info(f"Autotuned {target}: {best} (throughput batch {fastest['batch']}); saved to {path}")
+    return config["targets"][target]
+
+
+def maybe_autotune_on_startup(target: str = "biobert") -> None:
+    """With AUTOTUNE_ON_STARTUP=1, tune once per host before serving (skipped if a config exists)"""
+    if os.environ.get("AUTOTUNE_ON_STARTUP", "0").lower() not in ("1", "true", "yes"):
+        return
+    if load_config() is not None:
+        return
+    try:
+        autotune(target)
+    except Exception as e:
+        logger.error(f"Startup autotune failed, using defaults: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark torch thread counts and batch sizes for this host")
+    parser.add_argument("--targets", nargs="+", default=["biobert"], choices=TARGETS,
+                        help="Models to tune; the first one sets the process-wide thread counts")
+    parser.add_argument("--threads", nargs="+", type=int, default=None, help="Intra-op thread counts to try")
+    parser.add_argument("--interop", nargs="+", type=int, default=None, help="Inter-op thread counts to try")
+    parser.add_argument("--batches", nargs="+", type=int, default=None, help="Batch sizes to try")
+    parser.add_argument("--latency_ms", type=float, default=None, help="Per-batch latency budget for max_batch")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    for i, target in enumerate(args.targets):
+        tuned = autotune(
+            target,
+            thread_grid=args.threads,
+            interop_grid=args.interop,
+            batch_grid=args.batches,
+            latency_ms=args.latency_ms,
+            repeats=args.repeats,
+            set_threads=i == 0,
+        )
+        print({k: v for k, v in tuned.items() if k != "results"})
+    print(f"✅ Saved to {config_path()}")
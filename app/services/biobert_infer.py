@@ -1,23 +1,35 @@
 from __future__ import annotations
 
-from typing import List, Optional, Tuple, Dict
+from typing import Any, List, Optional, Tuple, Dict
 import os
 import joblib
+import numpy as np
 import torch
 import pandas as pd
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
 from ..triage.rules import map_triage
+from .autotune import apply_tuned_threads
+from .compiled import BucketedModel
+from .model_registry import ModelRegistry
+from .profiler import profile_stage
+from .segments import SegmentedClassifier
+
+
+def _default_model_path() -> str:
+    return os.environ.get("MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "models", "symptom_disease_model"))
 
 
 class BioBERTInferenceService:
-    _instance: Optional["BioBERTInferenceService"] = None
+    _registry: Optional[ModelRegistry] = None
+
+    MAX_LENGTH = 256
 
-    def __init__(self) -> None:
+    def __init__(self, model_path: Optional[str] = None) -> None:
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         
         # Load model and tokenizer
-        model_path = os.environ.get("MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "models", "symptom_disease_model"))
+        model_path = model_path or _default_model_path()
         if not os.path.exists(model_path):
             raise RuntimeError(f"Model not found at {model_path}. Please copy your trained model there.")
         
@@ -25,6 +37,8 @@ class BioBERTInferenceService:
         self.model = AutoModelForSequenceClassification.from_pretrained(model_path)
         self.model.to(self.device)
         self.model.eval()
+        # Opt-in length-bucketed torch.compile / TorchScript (COMPILE_MODE); compiled and warmed here
+        self.compiled = BucketedModel.from_env(self.model, "logits", self.MAX_LENGTH, self.tokenizer.pad_token_id or 0)
         
         # Load label encoder
         label_encoder_path = os.path.join(model_path, "label_encoder.pkl")
@@ -39,12 +53,38 @@ class BioBERTInferenceService:
         
         # Load treatment mapping
         self.treatment_map = self._load_treatment_mapping()
+        
+        # (disease, treatment) per class index, so responses are built straight from top-k indices
+        self.label_table: List[Tuple[str, str]] = [
+            (str(disease), self.treatment_map.get(disease, "Consult a healthcare provider for treatment recommendations"))
+            for disease in self.label_encoder.classes_
+        ]
+
+        # Long transcripts are classified per sentence/clause instead of being truncated;
+        # segment results are cached per model version (SEGMENT_MODE, SEGMENT_CACHE_SIZE)
+        self.segments = SegmentedClassifier(
+            predict_probs=lambda texts: self._probabilities(texts).cpu().numpy(),
+            token_spans=self._token_spans,
+            max_tokens=self.MAX_LENGTH,
+        )
 
     @classmethod
     def get_instance(cls) -> "BioBERTInferenceService":
-        if cls._instance is None:
-            cls._instance = BioBERTInferenceService()
-        return cls._instance
+        """The currently active model version"""
+        return cls.get_registry().current()
+
+    @classmethod
+    def get_registry(cls) -> ModelRegistry:
+        """Versioned model holder; watches MODEL_REGISTRY_DIR for new versions when set"""
+        if cls._registry is None:
+            apply_tuned_threads()
+            cls._registry = ModelRegistry(
+                loader=lambda path: BioBERTInferenceService(model_path=path),
+                warmup=lambda service: service.predict_batch(["fever and cough with headache"]),
+                default_path=_default_model_path(),
+                root=os.environ.get("MODEL_REGISTRY_DIR"),
+            )
+        return cls._registry
 
     def _load_treatment_mapping(self) -> Dict[str, str]:
         """Load treatment mapping from the dataset"""
@@ -67,33 +107,69 @@ class BioBERTInferenceService:
 
     def predict_with_confidence(self, text: str, top_k: int = 3) -> List[Tuple[str, float, str]]:
         """Predict disease with confidence and treatment recommendation"""
+        return self.predict_batch([text], top_k=top_k)[0]
+
+    def predict_batch(self, texts: List[str], top_k: int = 3) -> List[List[Tuple[str, float, str]]]:
+        """Predict diseases for several texts in one forward pass"""
+        probs, indices = self.topk(texts, top_k=top_k)
+        table = self.label_table
+        return [
+            [(table[i][0], p, table[i][1]) for p, i in zip(row_probs, row_indices)]
+            for row_probs, row_indices in zip(probs.tolist(), indices.tolist())
+        ]
+
+    def predict_dicts(self, texts: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """Like predict_batch, but rows are ready-to-encode prediction dicts"""
+        probs, indices = self.topk(texts, top_k=top_k)
+        table = self.label_table
+        return [
+            [
+                {"disease": table[i][0], "confidence": p, "treatment": table[i][1]}
+                for p, i in zip(row_probs, row_indices)
+            ]
+            for row_probs, row_indices in zip(probs.tolist(), indices.tolist())
+        ]
+
+    def topk(self, texts: List[str], top_k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k probabilities and class indices, shape (len(texts), k)"""
+        k = min(top_k, len(self.label_table))
+        segment = [self.segments.wants_segments(text) for text in texts]
+        if any(segment):
+            with profile_stage("biobert.segments"):
+                probabilities = self.segments.probabilities(texts, segment)
+            top_indices = np.argsort(-probabilities, axis=1, kind="stable")[:, :k]
+            return np.take_along_axis(probabilities, top_indices, axis=1), top_indices
+        
+        # Get top-k predictions
+        top_probs, top_indices = torch.topk(self._probabilities(texts), k=k)
+        return top_probs.cpu().numpy(), top_indices.cpu().numpy()
+
+    def _token_spans(self, texts: List[str]) -> List[List[Tuple[int, int, int]]]:
+        """(char start, char end, word index) of every token, without special tokens"""
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+        return [
+            [(start, end, word) for (start, end), word in zip(offsets, encoded.word_ids(i))]
+            for i, offsets in enumerate(encoded["offset_mapping"])
+        ]
+
+    def _probabilities(self, texts: List[str]) -> torch.Tensor:
+        """Class probabilities for each text in one forward pass, shape (len(texts), n_classes)"""
         with torch.no_grad():
             # Tokenize
-            inputs = self.tokenizer(
-                text,
-                truncation=True,
-                padding=True,
-                max_length=256,
-                return_tensors="pt"
-            )
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            with profile_stage("biobert.tokenize"):
+                inputs = self.tokenizer(
+                    texts,
+                    truncation=True,
+                    padding=True,
+                    max_length=self.MAX_LENGTH,
+                    return_tensors="pt"
+                )
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
             
             # Predict
-            outputs = self.model(**inputs)
-            logits = outputs.logits
-            probabilities = torch.softmax(logits, dim=-1)
-            
-            # Get top-k predictions
-            top_probs, top_indices = torch.topk(probabilities, k=min(top_k, len(self.label_encoder.classes_)))
-            
-            results = []
-            for prob, idx in zip(top_probs[0], top_indices[0]):
-                disease = self.label_encoder.classes_[idx.item()]
-                confidence = prob.item()
-                treatment = self.treatment_map.get(disease, "Consult a healthcare provider for treatment recommendations")
-                results.append((disease, confidence, treatment))
-            
-            return results
+            with profile_stage("biobert.forward"):
+                logits = self.compiled(inputs) if self.compiled is not None else self.model(**inputs).logits
+            return torch.softmax(logits, dim=-1)
 
     def predict_conditions(self, text: str, top_k: int = 3) -> List[str]:
         """Get just the disease names"""
@@ -0,0 +1,192 @@
+"""
+Shape-bucketed compiled execution for the BERT encoders (opt-in).
+
+Inputs are padded up to the nearest of a few fixed sequence lengths (COMPILE_BUCKETS),
+so each bucket is compiled once and warmed at startup instead of running eager
+PyTorch on arbitrary shapes. Inputs longer than the largest bucket, buckets that
+failed to compile and runtime errors all fall back to the eager model.
+
+COMPILE_MODE:
+- off (default): eager PyTorch
+- compile: torch.compile (inductor); the batch dimension stays dynamic
+- trace: TorchScript trace + freeze, one graph per bucket
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "compile", "trace")
+# Model versions (hot swaps) whose compiled graphs fit in dynamo's cache at once
+_COMPILED_VERSIONS = 4
+
+
+def compile_mode() -> str:
+    mode = os.environ.get("COMPILE_MODE", "off").lower()
+    if mode not in MODES:
+        logger.warning(f"Unknown COMPILE_MODE {mode!r}; expected one of {MODES}. Using eager.")
+        return "off"
+    return mode
+
+
+def compile_buckets(max_length: int) -> List[int]:
+    """COMPILE_BUCKETS (default 32,64,128,256) capped at ``max_length``, which is always a bucket"""
+    raw = os.environ.get("COMPILE_BUCKETS", "32,64,128,256")
+    buckets = {int(b) for b in raw.split(",") if b.strip() and 0 < int(b) < max_length}
+    return sorted(buckets | {max_length})
+
+
+def _size_dynamo_cache(buckets: int) -> None:
+    """
+    Make room in dynamo's per-function cache for every bucket graph (batch 1 and dynamic
+    batch per bucket) of a few model versions, which all share _SingleOutput.forward.
+
+    Past the limit dynamo would silently run eager; failing instead lets BucketedModel
+    count the call as an eager fallback and mark the bucket as not ready.
+    """
+    import torch._dynamo.config as dynamo_config
+
+    limit = 2 * buckets * _COMPILED_VERSIONS
+    for name in ("recompile_limit", "cache_size_limit"):
+        if hasattr(dynamo_config, name) and getattr(dynamo_config, name) < limit:
+            setattr(dynamo_config, name, limit)
+    for name in ("fail_on_recompile_limit_hit", "fail_on_cache_limit_hit"):
+        if hasattr(dynamo_config, name):
+            setattr(dynamo_config, name, True)
+
+
+class _SingleOutput(torch.nn.Module):
+    """Positional-input wrapper returning one tensor, as tracing and compilation prefer"""
+
+    def __init__(self, model: torch.nn.Module, output: str) -> None:
+        super().__init__()
+        self.model = model
+        self.output = output
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, token_type_ids: torch.Tensor) -> torch.Tensor:
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+        return getattr(outputs, self.output)
+
+
+class BucketedModel:
+    """
+    Runs ``model`` on inputs padded to fixed length buckets, each compiled or traced once.
+
+    Called with the tokenizer's tensors; returns the ``output`` attribute of the model
+    output (``logits`` or ``last_hidden_state``, the latter cut back to the input length).
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        output: str,
+        max_length: int,
+        pad_token_id: int = 0,
+        mode: Optional[str] = None,
+        buckets: Optional[List[int]] = None,
+    ) -> None:
+        self.mode = mode or compile_mode()
+        self.buckets = buckets or compile_buckets(max_length)
+        self.pad_token_id = pad_token_id
+        self.device = next(model.parameters()).device
+        self._module = _SingleOutput(model, output).eval()
+        self._compiled: Optional[Callable] = None
+        self._runners: Dict[int, Callable] = {}
+        self._calls = {bucket: 0 for bucket in self.buckets}
+        self.eager_calls = 0
+        self.compile_s: Dict[int, float] = {}
+
+    @classmethod
+    def from_env(cls, model: torch.nn.Module, output: str, max_length: int, pad_token_id: int = 0) -> Optional["BucketedModel"]:
+        """A warmed BucketedModel when COMPILE_MODE is set, else None"""
+        if compile_mode() == "off":
+            return None
+        bucketed = cls(model, output, max_length, pad_token_id)
+        bucketed.warmup()
+        return bucketed
+
+    def _example(self, batch: int, length: int) -> List[torch.Tensor]:
+        ids = torch.full((batch, length), self.pad_token_id, dtype=torch.long, device=self.device)
+        mask = torch.zeros_like(ids)
+        mask[:, : max(1, length // 2)] = 1
+        return [ids, mask, torch.zeros_like(ids)]
+
+    def _build(self, bucket: int) -> Callable:
+        if self.mode == "trace":
+            with torch.no_grad():
+                traced = torch.jit.trace(self._module, self._example(2, bucket), strict=False, check_trace=False)
+                return torch.jit.freeze(traced)
+        if self._compiled is None:
+            _size_dynamo_cache(len(self.buckets))
+            self._compiled = torch.compile(self._module, dynamic=False)
+        return self._compiled
+
+    def warmup(self) -> Dict[int, float]:
+        """Compile and run every bucket once (batch 1 and 2); buckets that fail stay on eager"""
+        for bucket in self.buckets:
+            start = time.perf_counter()
+            try:
+                runner = self._build(bucket)
+                with torch.no_grad():
+                    for batch in (2, 1):
+                        self._run(runner, self._example(batch, bucket))
+            except Exception as e:
+                logger.warning(f"{self.mode} failed for length bucket {bucket}, using eager for it: {e}")
+                continue
+            self._runners[bucket] = runner
+            self.compile_s[bucket] = round(time.perf_counter() - start, 2)
+        logger.info(f"{self.mode} buckets ready: {self.compile_s}")
+        return self.compile_s
+
+    def _run(self, runner: Callable, args: List[torch.Tensor]) -> torch.Tensor:
+        if self.mode == "compile" and args[0].shape[0] > 1:
+            # One graph per bucket for every batch size > 1 (batch 1 is specialized separately)
+            for tensor in args:
+                torch._dynamo.mark_dynamic(tensor, 0)
+        return runner(*args)
+
+    def _bucket_for(self, length: int) -> Optional[int]:
+        return next((b for b in self.buckets if b >= length and b in self._runners), None)
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        input_ids = inputs["input_ids"]
+        attention_mask = inputs["attention_mask"]
+        token_type_ids = inputs.get("token_type_ids")
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        length = input_ids.shape[1]
+
+        bucket = self._bucket_for(length)
+        if bucket is not None:
+            pad = bucket - length
+            args = [
+                F.pad(input_ids, (0, pad), value=self.pad_token_id),
+                F.pad(attention_mask, (0, pad), value=0),
+                F.pad(token_type_ids, (0, pad), value=0),
+            ]
+            try:
+                output = self._run(self._runners[bucket], args)
+                self._calls[bucket] += 1
+                return output[:, :length] if output.dim() == 3 else output
+            except Exception as e:
+                logger.warning(f"{self.mode} bucket {bucket} failed, falling back to eager: {e}")
+                self._runners.pop(bucket, None)
+
+        self.eager_calls += 1
+        return self._module(input_ids, attention_mask, token_type_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "buckets": {bucket: {"ready": bucket in self._runners, "calls": self._calls[bucket]} for bucket in self.buckets},
+            "eager_calls": self.eager_calls,
+            "compile_s": self.compile_s,
+        }
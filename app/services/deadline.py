@@ -0,0 +1,148 @@
+"""
+Per-request deadlines and wasted-work accounting.
+
+A Deadline is created for each request (X-Request-Timeout-Ms header, else
+REQUEST_DEADLINE_MS) and handed to every stage that works on it: queued work whose
+deadline has passed, or whose client disconnected, is dropped instead of run.
+wasted_work counts what was dropped and the compute spent on results nobody received.
+"""
+
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import math
+import os
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed (or its client disconnected) before the work ran"""
+
+
+class Deadline:
+    """
+    Monotonic expiry time plus a cancellation flag for client disconnects.
+
+    Work shared by several callers (coalesced requests) ``join`` their deadlines and
+    only counts as expired once every caller's deadline has.
+    """
+
+    def __init__(self, timeout_ms: Optional[float] = None) -> None:
+        self.expires_at = time.monotonic() + timeout_ms / 1000.0 if timeout_ms else math.inf
+        self.cancelled = False
+        self._joined: List["Deadline"] = []
+
+    @classmethod
+    def for_request(cls, timeout_ms: Optional[int] = None, items: int = 1) -> "Deadline":
+        """
+        Deadline from the request header, falling back to REQUEST_DEADLINE_MS (0 = none).
+
+        The default is per item, so a batch of ``items`` clips gets ``items`` times as long;
+        a timeout sent by the client covers the whole request.
+        """
+        if timeout_ms is None:
+            timeout_ms = int(os.environ.get("REQUEST_DEADLINE_MS", "10000")) * max(1, items)
+        return cls(timeout_ms)
+
+    def join(self, other: Optional["Deadline"]) -> None:
+        if other is not None and other is not self:
+            self._joined.append(other)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def _own_expired(self) -> bool:
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    def expired(self) -> bool:
+        return self._own_expired() and all(d.expired() for d in self._joined)
+
+    def remaining(self) -> float:
+        """Seconds left (inf without a deadline, 0 once expired)"""
+        if self.expired():
+            return 0.0
+        latest = max([self.expires_at] + [d.expires_at for d in self._joined if not d.expired()])
+        return max(0.0, latest - time.monotonic())
+
+    def own_remaining(self) -> float:
+        """Seconds left on this deadline alone, ignoring joined ones (inf without a deadline)"""
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+def expired(deadline: Optional[Deadline]) -> bool:
+    return deadline is not None and deadline.expired()
+
+
+class WastedWork:
+    """Counts work dropped because of deadlines and CPU time spent on results nobody got"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self.generate_stopped = 0
+        self.disconnects = 0
+
+    def _stage(self, stage: str) -> Dict[str, float]:
+        return self._stages.setdefault(stage, {"dropped": 0, "abandoned": 0, "wasted_s": 0.0})
+
+    def dropped(self, stage: str, n: int = 1) -> None:
+        """``n`` items skipped before running ``stage``"""
+        with self._lock:
+            self._stage(stage)["dropped"] += n
+
+    def abandoned(self, stage: str, seconds: float, n: int = 1) -> None:
+        """``n`` items finished ``stage`` after their deadline; ``seconds`` of work thrown away"""
+        with self._lock:
+            counts = self._stage(stage)
+            counts["abandoned"] += n
+            counts["wasted_s"] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {**counts, "wasted_s": round(counts["wasted_s"], 3)}
+                    for name, counts in self._stages.items()
+                },
+                "generate_stopped_early": self.generate_stopped,
+                "client_disconnects": self.disconnects,
+            }
+
+
+wasted_work = WastedWork()
+
+
+async def _watch_disconnect(request: Any, deadline: Deadline, interval: float) -> None:
+    while not deadline.expired():
+        if await request.is_disconnected():
+            deadline.cancel()
+            wasted_work.disconnects += 1
+            return
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def request_deadline(
+    request: Any, timeout_ms: Optional[int] = None, items: int = 1, interval: float = 0.1
+) -> AsyncIterator[Deadline]:
+    """
+    Deadline for a request, cancelled early if the client disconnects.
+
+    Enter only after the request body has been read: polling for a disconnect
+    consumes receive() messages.
+    """
+    deadline = Deadline.for_request(timeout_ms, items)
+    watcher = asyncio.ensure_future(_watch_disconnect(request, deadline, interval))
+    try:
+        yield deadline
+    finally:
+        watcher.cancel()
@@ -7,17 +7,22 @@ import numpy as np
 
 from ..transformers.embedder import PubMedBERTEmbedder
 from ..triage.rules import map_triage
+from .model_registry import ModelRegistry
+
+
+def _default_artifacts_dir() -> str:
+    return os.environ.get(
+        "ARTIFACTS_DIR",
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "artifacts")),
+    )
 
 
 class InferenceService:
-    _instance: Optional["InferenceService"] = None
+    _registry: Optional[ModelRegistry] = None
 
-    def __init__(self) -> None:
+    def __init__(self, artifacts_dir: Optional[str] = None) -> None:
         self.embedder = PubMedBERTEmbedder.get_instance()
-        artifacts_dir = os.environ.get(
-            "ARTIFACTS_DIR",
-            os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "artifacts")),
-        )
+        artifacts_dir = artifacts_dir or _default_artifacts_dir()
         classifier_path = os.path.abspath(os.path.join(artifacts_dir, "classifier.joblib"))
         labels_path = os.path.abspath(os.path.join(artifacts_dir, "labels.joblib"))
         if not os.path.exists(classifier_path) or not os.path.exists(labels_path):
@@ -29,9 +34,19 @@ class InferenceService:
 
     @classmethod
     def get_instance(cls) -> "InferenceService":
-        if cls._instance is None:
-            cls._instance = InferenceService()
-        return cls._instance
+        return cls.get_registry().current()
+
+    @classmethod
+    def get_registry(cls) -> ModelRegistry:
+        """Versioned classifier artifacts; watches ARTIFACTS_REGISTRY_DIR for new versions when set"""
+        if cls._registry is None:
+            cls._registry = ModelRegistry(
+                loader=lambda path: InferenceService(artifacts_dir=path),
+                warmup=lambda service: service.predict_with_confidence("fever and cough with headache"),
+                default_path=_default_artifacts_dir(),
+                root=os.environ.get("ARTIFACTS_REGISTRY_DIR"),
+            )
+        return cls._registry
 
     def predict_with_confidence(self, text: str, top_k: int = 3) -> List[Tuple[str, float]]:
         embedding = self.embedder.embed_texts([text])  # shape (1, d)
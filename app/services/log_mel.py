@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+import math
+import threading
+
+import numpy as np
+import torch
+
+
+class LogMelExtractor:
+    """
+    Whisper log-mel features for a batch of waveforms in one batched FFT.
+
+    Matches WhisperFeatureExtractor: clips are zero-padded/truncated to ``n_samples``,
+    framed with reflect padding (torch.stft center=True), windowed with a periodic Hann
+    window, then power spectrum, Slaney mel filterbank, log10 clamped to 8 below each
+    clip's peak and scaled by (x + 4) / 4.
+
+    Frames that lie entirely in the zero padding past the longest clip have zero power,
+    whose log-mel is exactly log10(1e-10), so the FFT only runs up to that clip's end.
+    Input, frame and spectrum buffers are preallocated and reused between calls.
+    """
+
+    _FLOOR = -10.0  # log10 of the 1e-10 clamp
+
+    def __init__(
+        self,
+        mel_filters: np.ndarray,
+        n_fft: int = 400,
+        hop_length: int = 160,
+        n_samples: int = 480000,
+        device: Optional[str] = None,
+    ) -> None:
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_samples = n_samples
+        self.n_frames = n_samples // hop_length
+        self.device = torch.device(device or "cpu")
+        # (n_freq, n_mels): frames x freq @ freq x mels keeps every operand contiguous
+        self.mel_filters = torch.from_numpy(np.ascontiguousarray(mel_filters)).to(self.device, torch.float32)
+        self.window = torch.hann_window(n_fft, device=self.device)
+        self._pad = n_fft // 2
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_feature_extractor(cls, feature_extractor, device: Optional[str] = None) -> "LogMelExtractor":
+        """Build from a transformers WhisperFeatureExtractor so filters and sizes match exactly"""
+        return cls(
+            feature_extractor.mel_filters,
+            n_fft=feature_extractor.n_fft,
+            hop_length=feature_extractor.hop_length,
+            n_samples=feature_extractor.n_samples,
+            device=device,
+        )
+
+    @property
+    def n_mels(self) -> int:
+        return self.mel_filters.shape[1]
+
+    def _buffer(self, name: str, *shape: int) -> torch.Tensor:
+        """Contiguous view of a reused flat buffer, grown when a bigger batch arrives"""
+        size = math.prod(shape)
+        flat = self._buffers.get(name)
+        if flat is None or flat.numel() < size:
+            flat = self._buffers[name] = torch.empty(size, device=self.device)
+        return flat[:size].view(*shape)
+
+    def _padded(self, waveforms: Sequence[np.ndarray]) -> torch.Tensor:
+        """(batch, pad + n_samples + pad) with zero padding to n_samples and reflect padding at the ends"""
+        pad, n_samples = self._pad, self.n_samples
+        audio = self._buffer("audio", len(waveforms), n_samples + 2 * pad)
+        for row, waveform in zip(audio, waveforms):
+            clip = torch.as_tensor(np.asarray(waveform)[:n_samples], dtype=torch.float32)
+            n = len(clip)
+            row[pad:pad + n].copy_(clip)
+            row[pad + n:].zero_()
+            row[:pad].copy_(row[pad + 1:2 * pad + 1].flip(0))
+            row[pad + n_samples:].copy_(row[n_samples - 1:n_samples + pad - 1].flip(0))
+        return audio
+
+    def __call__(self, waveforms: Sequence[np.ndarray]) -> torch.Tensor:
+        """(batch, n_mels, n_frames) float32 features on ``device``"""
+        batch = len(waveforms)
+        longest = max(min(len(w), self.n_samples) for w in waveforms)
+        # Frames reaching into the clip (or its reflect padding); later ones are all zeros
+        active = self.n_frames if longest == self.n_samples else min(
+            self.n_frames, math.ceil((self._pad + longest) / self.hop_length)
+        )
+        n_freq = self.n_fft // 2 + 1
+
+        features = torch.full((batch, self.n_mels, self.n_frames), self._FLOOR, device=self.device)
+        with self._lock, torch.no_grad():
+            audio = self._padded(waveforms)
+            frames = audio.unfold(1, self.n_fft, self.hop_length)[:, :active]
+            windowed = self._buffer("frames", batch, active, self.n_fft)
+            torch.mul(frames, self.window, out=windowed)
+            spectrum = torch.fft.rfft(windowed, dim=-1)
+            power = self._buffer("power", batch, active, n_freq)
+            torch.mul(spectrum.real, spectrum.real, out=power)
+            power.addcmul_(spectrum.imag, spectrum.imag)
+            mel = self._buffer("mel", batch, active, self.n_mels)
+            torch.matmul(power, self.mel_filters, out=mel)
+            features[:, :, :active] = mel.clamp_(min=1e-10).log10_().transpose(1, 2)
+
+        peak = features.amax(dim=(1, 2), keepdim=True)
+        features = torch.maximum(features, peak - 8.0)
+        return features.add_(4.0).div_(4.0)
+
+    def extract(self, waveforms: List[np.ndarray], max_batch: int = 8) -> torch.Tensor:
+        """Features for any number of clips, ``max_batch`` at a time, in input order"""
+        # Batch clips of similar length so short ones don't pay for a long one's frames
+        order = sorted(range(len(waveforms)), key=lambda i: len(waveforms[i]))
+        features = torch.empty(len(waveforms), self.n_mels, self.n_frames, device=self.device)
+        for start in range(0, len(order), max_batch):
+            chunk = order[start:start + max_batch]
+            features[chunk] = self([waveforms[i] for i in chunk])
+        return features
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import gc
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _version_key(name: str) -> tuple:
+    """Natural sort key so that v10 sorts after v9"""
+    return tuple((0, int(part)) if part.isdigit() else (1, part) for part in re.split(r"(\d+)", name) if part)
+
+
+class _Version:
+    def __init__(self, name: str, path: str, model: Any, load_s: float, warmup_s: float) -> None:
+        self.name = name
+        self.path = path
+        self.model = model
+        self.load_s = load_s
+        self.warmup_s = warmup_s
+        self.loaded_at = time.time()
+        self.refs = 0
+        self.retired = False
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.name,
+            "path": self.path,
+            "load_s": round(self.load_s, 3),
+            "warmup_s": round(self.warmup_s, 3),
+            "loaded_at": self.loaded_at,
+            "in_flight": self.refs,
+        }
+
+
+class ModelRegistry:
+    """
+    Serves the active version of a model and hot-swaps it without a restart.
+
+    ``root`` is a directory of versioned subdirectories (``v1/``, ``v2/``, ...). The newest
+    one is served unless ``root/CURRENT`` names a specific version. A background thread polls
+    ``root``; a new version is loaded and warmed off the request path, swapped in atomically
+    for new requests, and the old one is freed once its in-flight leases are released.
+    Without ``root`` the registry serves ``default_path`` as a single fixed version.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Any],
+        default_path: str,
+        root: Optional[str] = None,
+        warmup: Optional[Callable[[Any], None]] = None,
+        poll_interval: Optional[float] = None,
+    ) -> None:
+        self.loader = loader
+        self.warmup = warmup
+        self.root = root
+        self.default_path = default_path
+        self.poll_interval = poll_interval or float(os.environ.get("MODEL_REGISTRY_POLL_S", "10"))
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._retiring: List[_Version] = []
+        self._failed: Dict[str, str] = {}
+        self._loading: Optional[str] = None
+
+        name, path = self._target() or ("default", default_path)
+        self._active = self._load(name, path)
+
+        if self.root:
+            threading.Thread(target=self._watch, name="model-registry", daemon=True).start()
+
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+
+    def current(self) -> Any:
+        """The active model, without holding a lease"""
+        return self._active.model
+
+    @contextmanager
+    def lease(self) -> Iterator[Any]:
+        """Use the active model for one request; a swap mid-request does not free it underneath"""
+        with self._lock:
+            version = self._active
+            version.refs += 1
+        try:
+            yield version.model
+        finally:
+            with self._lock:
+                version.refs -= 1
+                release = version.retired and version.refs == 0
+            if release:
+                self._release(version)
+
+    # ------------------------------------------------------------------
+    # Versions
+    # ------------------------------------------------------------------
+
+    def versions(self) -> List[str]:
+        if not self.root or not os.path.isdir(self.root):
+            return []
+        return sorted(
+            (d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d))),
+            key=_version_key,
+        )
+
+    def _target(self) -> Optional[tuple]:
+        versions = self.versions()
+        if not versions:
+            return None
+        pinned = os.path.join(self.root, "CURRENT")
+        name = versions[-1]
+        if os.path.exists(pinned):
+            with open(pinned) as f:
+                name = f.read().strip() or name
+        return name, os.path.join(self.root, name)
+
+    def _load(self, name: str, path: str) -> _Version:
+        logger.info(f"Loading model version {name} from {path}")
+        start = time.perf_counter()
+        model = self.loader(path)
+        load_s = time.perf_counter() - start
+        start = time.perf_counter()
+        if self.warmup is not None:
+            self.warmup(model)
+        warmup_s = time.perf_counter() - start
+        logger.info(f"Model version {name} ready (load {load_s:.2f}s, warmup {warmup_s:.2f}s)")
+        return _Version(name, path, model, load_s, warmup_s)
+
+    def swap_to(self, name: str, path: Optional[str] = None) -> Dict[str, Any]:
+        """Load and warm a version, then make it active for new requests"""
+        path = path or os.path.join(self.root or "", name)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"Model version not found at {path}")
+        with self._swap_lock:
+            self._loading = name
+            try:
+                new = self._load(name, path)
+            finally:
+                self._loading = None
+            with self._lock:
+                old, self._active = self._active, new
+                old.retired = True
+                release = old.refs == 0
+                if not release:
+                    self._retiring.append(old)
+            self._failed.pop(name, None)
+        if release:
+            self._release(old)
+        return new.describe()
+
+    def reload(self, name: Optional[str] = None) -> Dict[str, Any]:
+        """Swap to ``name`` (or the newest/pinned version) now instead of waiting for the next poll"""
+        if name is None:
+            target = self._target()
+            if target is None:
+                raise FileNotFoundError(f"No model versions under {self.root}")
+            name = target[0]
+        return self.swap_to(name)
+
+    def _release(self, version: _Version) -> None:
+        with self._lock:
+            if version in self._retiring:
+                self._retiring.remove(version)
+        version.model = None
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logger.info(f"Released model version {version.name}")
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            target = self._target()
+            if target is None or target[0] == self._active.name or target[0] in self._failed:
+                continue
+            try:
+                self.swap_to(*target)
+            except Exception as e:
+                # Don't retry a broken version on every poll; a new version (or reload) clears it
+                logger.error(f"Failed to load model version {target[0]}: {e}")
+                self._failed[target[0]] = str(e)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self._active.describe(),
+                "retiring": [v.describe() for v in self._retiring],
+                "loading": self._loading,
+                "available": self.versions(),
+                "failed": dict(self._failed),
+                "watching": self.root,
+            }
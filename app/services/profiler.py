@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from contextlib import nullcontext
+from typing import Any, Deque, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS = ("torch_trace.json", "samples.folded", "report.json")
+
+# Leaf frames of threads parked waiting for work; sampling them only hides the busy threads
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_session: Optional["ProfileSession"] = None
+
+
+def profile_stage(name: str):
+    """Label a pipeline stage in the torch trace while a profiling session runs (no-op otherwise)"""
+    if _session is None:
+        return nullcontext()
+    return record_function(name)
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _Sampler(threading.Thread):
+    """Samples Python stacks of every thread via sys._current_frames()"""
+
+    def __init__(self, interval_s: float) -> None:
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def top(self, n: int = 25) -> Dict[str, List]:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        return {"self": self_counts.most_common(n), "inclusive": total_counts.most_common(n)}
+
+
+class ProfileSession:
+    def __init__(self, out_dir: str, max_requests: int, max_seconds: float, sample_ms: float) -> None:
+        # Random suffix: sessions started within the same second must not share a directory
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.dir = os.path.join(out_dir, self.id)
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.started_at = time.time()
+        self.requests: List[Dict[str, Any]] = []
+        self.inflight = 0
+        self.stop_reason: Optional[str] = None
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        kwargs: Dict[str, Any] = {}
+        try:
+            # Model calls run in executor threads; older torch only traces the starting thread
+            from torch._C._profiler import _ExperimentalConfig
+
+            kwargs["experimental_config"] = _ExperimentalConfig(profile_all_threads=True)
+            self.all_threads = True
+        except (ImportError, TypeError):
+            self.all_threads = False
+        self.torch = profile(activities=activities, record_shapes=True, profile_memory=True, **kwargs)
+        self.sampler = _Sampler(sample_ms / 1000.0)
+        self.started_tracemalloc = not tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if self.started_tracemalloc:
+            tracemalloc.start()
+        self.torch.start()
+        self.sampler.start()
+
+    def stop(self, reason: str) -> None:
+        """Stop collectors; must run on the thread that called start()"""
+        self.stop_reason = reason
+        self.sampler.stop()
+        self.torch.stop()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+    def write(self) -> None:
+        """Export artifacts (slow for long sessions; run off the event loop)"""
+        os.makedirs(self.dir, exist_ok=True)
+        self.torch.export_chrome_trace(os.path.join(self.dir, "torch_trace.json"))
+        with open(os.path.join(self.dir, "samples.folded"), "w") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        report = {
+            **self.describe(),
+            "requests": self.requests,
+            "python_samples": self.sampler.top(),
+            "torch_ops": [
+                {
+                    "name": e.key,
+                    "calls": e.count,
+                    "self_cpu_ms": round(e.self_cpu_time_total / 1000, 3),
+                    "cpu_total_ms": round(e.cpu_time_total / 1000, 3),
+                }
+                for e in sorted(self.torch.key_averages(), key=lambda e: e.self_cpu_time_total, reverse=True)[:40]
+            ],
+        }
+        with open(os.path.join(self.dir, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "session": self.id,
+            "started_at": self.started_at,
+            "max_requests": self.max_requests,
+            "max_seconds": self.max_seconds,
+            "requests_profiled": len(self.requests),
+            "python_samples": self.sampler.samples,
+            "torch_all_threads": self.all_threads,
+            "stopped": self.stop_reason,
+        }
+
+
+class Profiler:
+    """
+    Admin-triggered profiling of the next N requests or T seconds, whichever comes first.
+
+    While a session runs it collects a torch profiler trace (ops, shapes, memory), a
+    sampled Python profile of all threads, and per-request duration, tracemalloc peak and
+    RSS delta. Artifacts land in ``PROFILE_DIR/<session>/``. With no session running the
+    only cost is one attribute check per request in ``ProfilingMiddleware``.
+    """
+
+    def __init__(self, out_dir: Optional[str] = None) -> None:
+        self.out_dir = out_dir or os.environ.get("PROFILE_DIR", "profiles")
+        self.session: Optional[ProfileSession] = None
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self, max_requests: int, max_seconds: float, sample_ms: float = 5.0) -> Dict[str, Any]:
+        """Begin a session; call from the event loop"""
+        global _session
+        if self.session is not None:
+            raise RuntimeError(f"Profiling session {self.session.id} already running")
+        session = ProfileSession(self.out_dir, max_requests, max_seconds, sample_ms)
+        session.start()
+        self.session = _session = session
+        self._timer = asyncio.get_running_loop().call_later(
+            max_seconds, lambda: asyncio.ensure_future(self.finish("time limit"))
+        )
+        logger.info(f"Profiling session {session.id} started ({max_requests} requests / {max_seconds}s)")
+        return session.describe()
+
+    async def finish(self, reason: str = "stopped") -> Optional[Dict[str, Any]]:
+        global _session
+        session = self.session
+        if session is None:
+            return None
+        self.session = _session = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        session.stop(reason)
+        await asyncio.to_thread(session.write)
+        summary = session.describe()
+        self.history.appendleft(summary)
+        logger.info(f"Profiling session {session.id} finished ({reason}); artifacts in {session.dir}")
+        return summary
+
+    def artifact_path(self, session_id: str, artifact: str) -> Optional[str]:
+        if artifact not in ARTIFACTS or not any(s["session"] == session_id for s in self.history):
+            return None
+        path = os.path.join(self.out_dir, session_id, artifact)
+        return path if os.path.exists(path) else None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.session.describe() if self.session else None,
+            "sessions": list(self.history),
+            "artifacts": list(ARTIFACTS),
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware feeding requests to the active profiling session (admin routes excluded)"""
+
+    def __init__(self, app, profiler: Profiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        session = self.profiler.session
+        if session is None or scope["type"] != "http" or scope["path"].startswith("/admin"):
+            return await self.app(scope, receive, send)
+
+        status = {"code": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        overlapped = session.inflight > 0
+        if not overlapped:
+            tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        rss_before = _rss_kb()
+        start = time.perf_counter()
+        session.inflight += 1
+        try:
+            # Covers the whole response, including streamed bodies
+            with record_function(f"request {scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            session.inflight -= 1
+            if self.profiler.session is session:
+                session.requests.append({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status["code"],
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                    # Peak is process-wide: with overlapping requests it includes their allocations
+                    "py_peak_kb": round((tracemalloc.get_traced_memory()[1] - traced_before) / 1024, 1),
+                    "rss_delta_kb": _rss_kb() - rss_before,
+                    "overlapped": overlapped or session.inflight > 0,
+                })
+                if len(session.requests) >= session.max_requests:
+                    asyncio.ensure_future(self.profiler.finish("request limit"))
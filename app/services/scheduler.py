@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+import asyncio
+import math
+import os
+import time
+
+from .deadline import Deadline, DeadlineExceeded, expired, wasted_work
+
+
+HIGH = "high"
+LOW = "low"
+
+
+class Overloaded(Exception):
+    """Raised for low-priority work that would miss (or has missed) the queue-latency SLO"""
+
+
+class _Pending:
+    __slots__ = ("text", "future", "enqueued_at", "deadline")
+
+    def __init__(self, text: str, future: asyncio.Future, deadline: Optional[Deadline] = None) -> None:
+        self.text = text
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.deadline = deadline
+
+
+class InferenceScheduler:
+    """
+    Two-lane micro-batching queue in front of the text classifier.
+
+    High-priority work (red-flag triage) is always dispatched first and never shed.
+    Low-priority work is rejected with ``Overloaded`` when its expected or actual queue
+    wait exceeds ``slo_ms``, so callers can degrade to a rules-only response.
+    Work in either lane is dropped with ``DeadlineExceeded`` once its request deadline passes.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[str]], List[Any]],
+        max_batch: Optional[int] = None,
+        slo_ms: Optional[float] = None,
+    ) -> None:
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch or int(os.environ.get("INFERENCE_MAX_BATCH", "8"))
+        self.slo_s = (slo_ms if slo_ms is not None else float(os.environ.get("INFERENCE_QUEUE_SLO_MS", "500"))) / 1000.0
+        self._lanes: Dict[str, Deque[_Pending]] = {HIGH: deque(), LOW: deque()}
+        self._waits: Dict[str, Deque[float]] = {HIGH: deque(maxlen=512), LOW: deque(maxlen=512)}
+        self._counts = {lane: {"served": 0, "shed": 0, "expired": 0} for lane in (HIGH, LOW)}
+        self._batch_s = 0.0  # EWMA of batch service time
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _expected_wait(self) -> float:
+        queued = len(self._lanes[HIGH]) + len(self._lanes[LOW]) + 1
+        return math.ceil(queued / self.max_batch) * self._batch_s
+
+    async def submit(self, text: str, priority: str = LOW, deadline: Optional[Deadline] = None) -> Any:
+        """Queue one text for classification and await its result"""
+        self._ensure_worker()
+        if expired(deadline):
+            self._counts[priority]["expired"] += 1
+            wasted_work.dropped("classify")
+            raise DeadlineExceeded("Deadline exceeded before classification")
+        if priority == LOW and self._expected_wait() > self.slo_s:
+            self._counts[LOW]["shed"] += 1
+            raise Overloaded("Inference queue over latency SLO")
+        pending = _Pending(text, asyncio.get_running_loop().create_future(), deadline)
+        self._lanes[priority].append(pending)
+        self._wakeup.set()
+        return await pending.future
+
+    def _next_batch(self) -> List[_Pending]:
+        batch: List[_Pending] = []
+        now = time.perf_counter()
+        for lane in (HIGH, LOW):
+            queue = self._lanes[lane]
+            while queue and len(batch) < self.max_batch:
+                pending = queue.popleft()
+                if pending.future.done():
+                    continue  # caller went away
+                if expired(pending.deadline):
+                    self._counts[lane]["expired"] += 1
+                    wasted_work.dropped("classify")
+                    pending.future.set_exception(DeadlineExceeded("Deadline exceeded in inference queue"))
+                    continue
+                wait = now - pending.enqueued_at
+                if lane == LOW and wait > self.slo_s:
+                    self._counts[LOW]["shed"] += 1
+                    pending.future.set_exception(Overloaded("Queued past latency SLO"))
+                    continue
+                self._waits[lane].append(wait)
+                self._counts[lane]["served"] += 1
+                batch.append(pending)
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._lanes[HIGH] and not self._lanes[LOW]:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            batch = self._next_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.predict_batch, [p.text for p in batch])
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            self._batch_s = elapsed if self._batch_s == 0.0 else 0.8 * self._batch_s + 0.2 * elapsed
+            late = sum(1 for pending in batch if expired(pending.deadline))
+            if late:
+                wasted_work.abandoned("classify", elapsed * late / len(batch), late)
+            for pending, result in zip(batch, results):
+                if pending.future.done():
+                    continue
+                if expired(pending.deadline):
+                    # Same outcome as the voice path: a late result is not served
+                    pending.future.set_exception(DeadlineExceeded("Deadline exceeded during inference"))
+                else:
+                    pending.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for lane in (HIGH, LOW):
+            waits = sorted(self._waits[lane])
+            lanes[lane] = {
+                "depth": len(self._lanes[lane]),
+                **self._counts[lane],
+                "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                "wait_ms_p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else 0.0,
+            }
+        return {
+            "lanes": lanes,
+            "slo_ms": self.slo_s * 1000,
+            "max_batch": self.max_batch,
+            "batch_ms_ewma": round(self._batch_s * 1000, 1),
+        }
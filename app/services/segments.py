@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+import re
+import threading
+
+import numpy as np
+
+MODES = ("off", "auto", "always")
+
+_SENTENCE = re.compile(r"(?<=[.!?;])\s+|\n+")
+_CLAUSE = re.compile(r"\s*,\s*|\s+(?:but|also|plus)\s+", re.IGNORECASE)
+_WORD = re.compile(r"\w")
+_WHITESPACE = re.compile(r"\s+")
+
+# Per token: (char start, char end, word index) - the tokenizer's offsets and word ids
+TokenSpans = List[Tuple[int, int, int]]
+
+
+def _windows(text: str, spans: TokenSpans, max_tokens: int) -> List[str]:
+    """Pieces of ``text`` with at most ``max_tokens`` tokens each, cut between words"""
+    pieces = []
+    start = 0
+    while start < len(spans):
+        end = min(start + max_tokens, len(spans))
+        if end < len(spans):
+            # Back off to the start of the word the cut would split (unless that word alone is too long)
+            cut = end
+            while cut > start and spans[cut][2] == spans[cut - 1][2]:
+                cut -= 1
+            end = cut if cut > start else end
+        piece = text[spans[start][0]:spans[end - 1][1]]
+        if _WORD.search(piece):
+            pieces.append(_WHITESPACE.sub(" ", piece).strip())
+        start = end
+    return pieces
+
+
+def split_segments(text: str, token_spans: Callable[[List[str]], List[TokenSpans]], max_tokens: int) -> List[str]:
+    """
+    Sentences of at most ``max_tokens`` tokens; longer ones are split into clauses, and
+    clauses still over budget into token windows cut at word boundaries. Cutting only
+    between words means each segment tokenizes to the same pieces again, so none is truncated.
+    """
+    sentences = [s for s in _SENTENCE.split(text) if _WORD.search(s)]
+    if not sentences:
+        return []
+    segments = []
+    for sentence, spans in zip(sentences, token_spans(sentences)):
+        if len(spans) <= max_tokens:
+            segments.append(_WHITESPACE.sub(" ", sentence).strip())
+            continue
+        clauses = [c for c in _CLAUSE.split(sentence) if _WORD.search(c)]
+        for clause, clause_spans in zip(clauses, token_spans(clauses)):
+            segments.extend(_windows(clause, clause_spans, max_tokens))
+    return segments
+
+
+def segment_key(segment: str) -> str:
+    """Cache key: case-, whitespace- and trailing-punctuation-insensitive"""
+    return _WHITESPACE.sub(" ", segment).strip().rstrip(".!?;,").lower()
+
+
+class SegmentCache:
+    """Thread-safe LRU of segment key -> (class probabilities, token count)"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: "OrderedDict[str, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, int]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key: str, value: Tuple[np.ndarray, int]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class SegmentedClassifier:
+    """
+    Classifies long or multi-sentence texts segment by segment.
+
+    Texts are split into sentence/clause segments; segments not already in the LRU cache
+    are classified together with any unsegmented texts in one batched pass, and each
+    text's probabilities are the token-weighted mean over its segments. Repeated
+    sentences (e.g. follow-up messages in a consultation) are served from the cache.
+
+    SEGMENT_MODE: ``auto`` segments only texts longer than ``max_tokens`` (which would
+    otherwise be truncated), ``always`` segments every text, ``off`` disables it.
+    """
+
+    def __init__(
+        self,
+        predict_probs: Callable[[List[str]], np.ndarray],
+        token_spans: Callable[[List[str]], List[TokenSpans]],
+        max_tokens: int,
+        mode: Optional[str] = None,
+        cache_size: Optional[int] = None,
+        batch_size: int = 32,
+    ) -> None:
+        self.predict_probs = predict_probs
+        self.token_spans = token_spans
+        # Room for [CLS] and [SEP]
+        self.max_tokens = max_tokens - 2
+        self.mode = (mode or os.environ.get("SEGMENT_MODE", "auto")).lower()
+        if self.mode not in MODES:
+            raise ValueError(f"SEGMENT_MODE must be one of {MODES}, got {self.mode!r}")
+        self.cache = SegmentCache(cache_size if cache_size is not None else int(os.environ.get("SEGMENT_CACHE_SIZE", "4096")))
+        self.batch_size = batch_size
+        self.segmented_texts = 0
+
+    def wants_segments(self, text: str) -> bool:
+        if self.mode == "always":
+            return True
+        if self.mode == "off" or len(text) <= self.max_tokens:
+            return False  # every token covers at least one character
+        return len(self.token_spans([text])[0]) > self.max_tokens
+
+    def probabilities(self, texts: List[str], segment: List[bool]) -> np.ndarray:
+        """(len(texts), n_classes) probabilities; texts flagged in ``segment`` are classified per segment"""
+        plans: List[List[str]] = []
+        known: Dict[str, Tuple[np.ndarray, int]] = {}
+        todo: Dict[str, str] = {}
+        for text, split in zip(texts, segment):
+            if not split:
+                plans.append([])
+                continue
+            keys = []
+            for seg in split_segments(text, self.token_spans, self.max_tokens) or [text]:
+                key = segment_key(seg)
+                keys.append(key)
+                if key in known or key in todo:
+                    continue
+                cached = self.cache.get(key)
+                if cached is None:
+                    todo[key] = seg
+                else:
+                    known[key] = cached
+            plans.append(keys)
+            self.segmented_texts += 1
+
+        whole = [text for text, split in zip(texts, segment) if not split]
+        new_keys, new_segments = list(todo), list(todo.values())
+        batch = whole + new_segments
+        probs = np.concatenate([
+            self.predict_probs(batch[i:i + self.batch_size]) for i in range(0, len(batch), self.batch_size)
+        ]) if batch else np.empty((0, 0), dtype=np.float32)
+
+        for key, row, spans in zip(new_keys, probs[len(whole):], self.token_spans(new_segments) if new_segments else []):
+            known[key] = (row, max(1, len(spans)))
+            self.cache.put(key, known[key])
+
+        out = []
+        whole_rows = iter(probs[:len(whole)])
+        for keys in plans:
+            if not keys:
+                out.append(next(whole_rows))
+                continue
+            rows = np.stack([known[key][0] for key in keys])
+            weights = np.array([known[key][1] for key in keys], dtype=np.float32)
+            out.append(weights @ rows / weights.sum())
+        return np.stack(out)
+
+    def stats(self) -> Dict[str, object]:
+        return {"mode": self.mode, "segmented_texts": self.segmented_texts, "cache": self.cache.stats()}
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Hashable, Optional, Union
+import asyncio
+import hashlib
+import math
+import re
+
+from .deadline import Deadline, DeadlineExceeded
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def text_key(text: str, *extra: Any) -> tuple:
+    """Coalescing key for a free-text request: case- and whitespace-insensitive"""
+    return (_WHITESPACE.sub(" ", text).strip().lower(),) + extra
+
+
+def content_key(data: Union[bytes, BinaryIO], *extra: Any) -> tuple:
+    """Coalescing key for a binary payload such as an audio upload (bytes or a seekable file)"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        digest = hashlib.sha256(data).hexdigest()
+    else:
+        sha = hashlib.sha256()
+        data.seek(0)
+        for chunk in iter(lambda: data.read(1024 * 1024), b""):
+            sha.update(chunk)
+        data.seek(0)
+        digest = sha.hexdigest()
+    return (digest,) + extra
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one in-flight computation.
+
+    The first caller for a key starts the work; callers arriving while it runs await
+    the same result instead of starting another. Nothing is kept once the work
+    finishes, so this is not a result cache.
+
+    The work runs under the first caller's deadline; later callers join theirs, so it is
+    only abandoned once every caller has timed out or disconnected. Each caller still
+    gets DeadlineExceeded once its own deadline passes.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._deadlines: Dict[Hashable, Deadline] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], deadline: Optional[Deadline] = None) -> Any:
+        task: Optional[asyncio.Task] = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            # Run as its own task so a disconnecting first caller does not cancel the others
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            if deadline is not None:
+                self._deadlines[key] = deadline
+            task.add_done_callback(lambda _: (self._inflight.pop(key, None), self._deadlines.pop(key, None)))
+        else:
+            self.coalesced += 1
+            shared = self._deadlines.get(key)
+            if shared is not None:
+                shared.join(deadline)
+
+        # The work lives as long as any caller's deadline; each caller only waits out its own
+        remaining = deadline.own_remaining() if deadline is not None else math.inf
+        if remaining == math.inf:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), remaining)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Deadline exceeded waiting for the shared result") from None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
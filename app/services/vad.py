@@ -0,0 +1,89 @@
+"""
+Energy-based voice activity detection for trimming silence before Whisper.
+
+Everything is computed on whole-frame arrays (no per-sample Python loops):
+frame RMS energy -> voiced mask -> padding/closing of short gaps -> compaction.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Tuple
+import numpy as np
+
+
+def _frame_energy_db(audio: np.ndarray, frame_length: int) -> np.ndarray:
+    """RMS energy per frame in dB relative to the loudest frame"""
+    n_frames = int(np.ceil(len(audio) / frame_length))
+    padded = np.zeros(n_frames * frame_length, dtype=np.float32)
+    padded[: len(audio)] = audio
+    frames = padded.reshape(n_frames, frame_length)
+    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+    return 20.0 * np.log10(rms / max(float(rms.max()), 1e-12))
+
+
+def _fill_short_gaps(mask: np.ndarray, max_gap: int) -> np.ndarray:
+    """Mark silent runs shorter than ``max_gap`` frames (between voiced frames) as voiced"""
+    edges = np.diff(np.concatenate(([1], mask.astype(np.int8), [1])))
+    starts = np.flatnonzero(edges == -1)
+    ends = np.flatnonzero(edges == 1)
+    interior = (starts > 0) & (ends < len(mask))
+    short = interior & ((ends - starts) < max_gap)
+    if not short.any():
+        return mask
+    # Vectorized range fill: +1 at gap start, -1 at gap end, cumulative sum > 0
+    delta = np.zeros(len(mask) + 1, dtype=np.int32)
+    np.add.at(delta, starts[short], 1)
+    np.add.at(delta, ends[short], -1)
+    return mask | (np.cumsum(delta[:-1]) > 0)
+
+
+def trim_silence(
+    audio: np.ndarray,
+    sample_rate: int = 16000,
+    frame_ms: int = 30,
+    threshold_db: float = -40.0,
+    pad_ms: int = 150,
+    min_silence_ms: int = 400,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Drop leading/trailing silence and compact long pauses.
+
+    Frames quieter than ``threshold_db`` below the loudest frame count as silence.
+    Voiced regions are padded by ``pad_ms`` on both sides, pauses shorter than
+    ``min_silence_ms`` are kept intact, and longer ones are cut down to the padding.
+
+    Returns:
+        Tuple of (trimmed waveform, stats dict)
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    original_seconds = len(audio) / sample_rate
+    stats = {
+        "original_seconds": round(original_seconds, 3),
+        "trimmed_seconds": round(original_seconds, 3),
+        "removed_fraction": 0.0,
+    }
+    frame_length = max(1, int(sample_rate * frame_ms / 1000))
+    if len(audio) < frame_length:
+        return audio, stats
+
+    voiced = _frame_energy_db(audio, frame_length) > threshold_db
+    if not voiced.any():
+        # Nothing above threshold; leave the clip to Whisper rather than returning nothing
+        return audio, stats
+
+    # Dilate voiced frames by the padding on both sides
+    pad_frames = max(0, int(np.ceil(pad_ms / frame_ms)))
+    if pad_frames:
+        kernel = np.ones(2 * pad_frames + 1, dtype=np.int32)
+        # "full" plus a centered slice keeps one value per frame even for clips shorter than the kernel
+        dilated = np.convolve(voiced.astype(np.int32), kernel, mode="full")
+        voiced = dilated[pad_frames: pad_frames + len(voiced)] > 0
+    voiced = _fill_short_gaps(voiced, int(np.ceil(min_silence_ms / frame_ms)))
+
+    sample_mask = np.repeat(voiced, frame_length)[: len(audio)]
+    trimmed = audio[sample_mask]
+
+    trimmed_seconds = len(trimmed) / sample_rate
+    stats["trimmed_seconds"] = round(trimmed_seconds, 3)
+    stats["removed_fraction"] = round(1.0 - trimmed_seconds / original_seconds, 4) if original_seconds else 0.0
+    return trimmed, stats
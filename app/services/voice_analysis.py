@@ -0,0 +1,390 @@
+"""
+Voice Analysis Service
+Runs voice input through a staged pipeline:
+
+    audio decode -> silence trimming (VAD) -> log-mel extraction -> Whisper generation
+    -> BioBERT classification + triage
+
+Stages are connected by bounded queues so that CPU-bound decoding of clip N+1
+overlaps with Whisper generation on clip N. Each stage has its own concurrency
+setting, and results are streamed back as each clip completes. The log-mel and
+Whisper stages take every clip already waiting in their queue as one batch.
+
+Each clip carries its request's deadline: a stage skips clips whose deadline has
+passed (or whose client disconnected), and Whisper generation stops early once every
+clip in its batch has expired.
+"""
+
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import torch
+
+from .biobert_infer import BioBERTInferenceService
+from .deadline import Deadline, expired, wasted_work
+from .vad import trim_silence
+from .whisper_integration import AudioSource, WhisperIntegrationService
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class _ClipJob:
+    index: int
+    audio_data: AudioSource
+    language: str
+    user_info: Dict[str, Any]
+    speculative: bool = False
+    deadline: Optional[Deadline] = None
+    audio: Any = None
+    vad_stats: Optional[Dict[str, Any]] = None
+    features: Any = None
+    transcription: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+
+
+_DONE = object()
+
+
+class VoiceAnalysisService:
+    """Voice-to-symptom analysis built on Whisper and the BioBERT classifier"""
+
+    _instance: Optional["VoiceAnalysisService"] = None
+
+    def __init__(self) -> None:
+        self.whisper = WhisperIntegrationService.get_instance()
+        self.text_models = BioBERTInferenceService.get_registry()
+
+        # Per-stage concurrency and queue depth between stages
+        self.stage_workers = {
+            "decode": _env_int("VOICE_DECODE_WORKERS", 2),
+            "vad": _env_int("VOICE_VAD_WORKERS", 1),
+            "features": _env_int("VOICE_FEATURE_WORKERS", 1),
+            "transcribe": _env_int("VOICE_TRANSCRIBE_WORKERS", 1),
+            "classify": _env_int("VOICE_CLASSIFY_WORKERS", 1),
+        }
+        # Max clips per call for the batched stages (only clips already queued are grouped)
+        self.stage_batch = {
+            "features": _env_int("VOICE_FEATURE_BATCH", 4),
+            "transcribe": _env_int("VOICE_TRANSCRIBE_BATCH", 4),
+        }
+        self.queue_size = _env_int("VOICE_STAGE_QUEUE_SIZE", 4)
+        self.vad_enabled = os.environ.get("VOICE_VAD", "1") == "1"
+        self.vad_threshold_db = float(os.environ.get("VOICE_VAD_THRESHOLD_DB", "-40"))
+
+        # Stage limits are shared by all requests so concurrent batches cannot
+        # oversubscribe the CPU; each stage gets its own slice of the executor.
+        self._stage_limits = {name: asyncio.Semaphore(n) for name, n in self.stage_workers.items()}
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(self.stage_workers.values()),
+            thread_name_prefix="voice-stage",
+        )
+
+    @classmethod
+    def get_instance(cls) -> "VoiceAnalysisService":
+        if cls._instance is None:
+            cls._instance = VoiceAnalysisService()
+        return cls._instance
+
+    # ------------------------------------------------------------------
+    # Stage bodies (blocking, run in the executor)
+    # ------------------------------------------------------------------
+
+    def _whisper_available(self) -> bool:
+        return self.whisper.model is not None and self.whisper.processor is not None
+
+    def _decode(self, job: _ClipJob) -> None:
+        if self._whisper_available():
+            job.audio = self.whisper.decode_audio(job.audio_data)
+        # Encoded audio is no longer needed once decoded (files are closed by their owner)
+        job.audio_data = b""
+
+    def _trim(self, job: _ClipJob) -> None:
+        if self.vad_enabled and job.audio is not None:
+            job.audio, job.vad_stats = trim_silence(job.audio, threshold_db=self.vad_threshold_db)
+
+    def _extract_features(self, jobs: List[_ClipJob]) -> None:
+        if self._whisper_available():
+            features = self.whisper.extract_features_batch([job.audio for job in jobs])
+            for job, row in zip(jobs, features):
+                job.features = row.unsqueeze(0)
+        for job in jobs:
+            job.audio = None
+
+    def _transcribe(self, jobs: List[_ClipJob]) -> None:
+        # Clips of one batch share language and decoding mode
+        if self._whisper_available():
+            transcriptions = self.whisper.generate_transcriptions(
+                torch.cat([job.features for job in jobs]),
+                jobs[0].language,
+                speculative=jobs[0].speculative,
+                deadlines=[job.deadline or Deadline() for job in jobs],
+            )
+        else:
+            transcriptions = [self.whisper.generate_transcription(None, job.language) for job in jobs]
+        for job, transcription in zip(jobs, transcriptions):
+            job.transcription = transcription
+            job.features = None
+
+    def _classify(self, job: _ClipJob) -> None:
+        job.result = self._build_result(job)
+
+    def _build_result(self, job: _ClipJob) -> Dict[str, Any]:
+        transcription = job.transcription or {}
+        text = transcription.get("transcription", "")
+        if not transcription.get("success") or not text:
+            return {
+                "index": job.index,
+                "success": False,
+                "error": transcription.get("error", "No speech detected in audio"),
+                "transcription": text,
+                "language": transcription.get("language", job.language),
+                "analysis": None,
+                "user_info": job.user_info,
+            }
+
+        with self.text_models.lease() as text_service:
+            preds = text_service.predict_with_confidence(text, top_k=3)
+            next_step = text_service.map_next_step(
+                text, age=job.user_info.get("age"), gender=job.user_info.get("gender")
+            )
+        predictions = [
+            {"disease": disease, "confidence": confidence, "treatment": treatment}
+            for disease, confidence, treatment in preds
+        ]
+        top = predictions[0] if predictions else None
+
+        return {
+            "index": job.index,
+            "success": True,
+            "transcription": text,
+            "language": transcription.get("language", job.language),
+            "model": transcription.get("model"),
+            "translated": transcription.get("translated", False),
+            "vad": job.vad_stats,
+            "analysis": {
+                "predictions": predictions,
+                "top_prediction": top["disease"] if top else None,
+                "confidence": top["confidence"] if top else 0.0,
+                "next_step": next_step,
+                "recommendations": [p["treatment"] for p in predictions[:1]] + [next_step],
+            },
+            "user_info": job.user_info,
+        }
+
+    def _error_result(self, job: _ClipJob, stage: str, error: Exception) -> Dict[str, Any]:
+        logger.error(f"Voice pipeline stage '{stage}' failed for clip {job.index}: {error}")
+        return {
+            "index": job.index,
+            "success": False,
+            "error": f"{stage} failed: {error}",
+            "transcription": "",
+            "language": job.language,
+            "analysis": None,
+            "user_info": job.user_info,
+        }
+
+    def _expired_result(self, job: _ClipJob, stage: str) -> Dict[str, Any]:
+        return {
+            "index": job.index,
+            "success": False,
+            "error": f"Deadline exceeded at {stage}",
+            "deadline_exceeded": True,
+            "transcription": "",
+            "language": job.language,
+            "analysis": None,
+            "user_info": job.user_info,
+        }
+
+    # ------------------------------------------------------------------
+    # Pipeline plumbing
+    # ------------------------------------------------------------------
+
+    async def _run_stage(
+        self,
+        name: str,
+        body: Callable[[Any], None],
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        max_batch = self.stage_batch.get(name)
+        while True:
+            job = await inbox.get()
+            if job is _DONE:
+                # Let sibling workers of this stage see the sentinel too
+                await inbox.put(_DONE)
+                return
+            jobs = [job]
+            # Batched stages also take whatever is already queued, without waiting for more
+            while max_batch and len(jobs) < max_batch and not inbox.empty():
+                queued = inbox.get_nowait()
+                if queued is _DONE:
+                    inbox.put_nowait(_DONE)
+                    break
+                jobs.append(queued)
+            pending = []
+            for j in jobs:
+                if j.result is None and expired(j.deadline):
+                    j.result = self._expired_result(j, name)
+                    wasted_work.dropped(name)
+                if j.result is None:
+                    pending.append(j)
+            if pending:
+                try:
+                    async with self._stage_limits[name]:
+                        # Re-check: the deadline may have passed while waiting for a worker slot
+                        pending = [j for j in pending if not self._drop_if_expired(j, name)]
+                        if pending:
+                            start = time.perf_counter()
+                            await loop.run_in_executor(self._executor, body, pending if max_batch else pending[0])
+                            self._discard_late(pending, name, time.perf_counter() - start)
+                except Exception as e:
+                    for j in pending:
+                        j.result = self._error_result(j, name, e)
+            for j in jobs:
+                await outbox.put(j)
+
+    def _drop_if_expired(self, job: _ClipJob, stage: str) -> bool:
+        if not expired(job.deadline):
+            return False
+        job.result = self._expired_result(job, stage)
+        wasted_work.dropped(stage)
+        return True
+
+    def _discard_late(self, jobs: List[_ClipJob], stage: str, elapsed: float) -> None:
+        """Results finished after their deadline are dropped; the time spent on them is counted as waste"""
+        late = [j for j in jobs if expired(j.deadline)]
+        for j in late:
+            j.result = self._expired_result(j, stage)
+        if late:
+            wasted_work.abandoned(stage, elapsed * len(late) / len(jobs), len(late))
+
+    async def stream_batch(
+        self,
+        audio_data_list: List[AudioSource],
+        language: str = "en",
+        user_info: Optional[Dict[str, Any]] = None,
+        speculative: bool = False,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run clips through the staged pipeline, yielding each result as soon as it completes
+
+        Clips still in flight when the consumer stops iterating (e.g. a streaming client
+        disconnected) are abandoned: ``deadline`` is cancelled so generation stops early.
+        """
+        deadline = deadline or Deadline()
+        user_info = user_info or {}
+        stages = [
+            ("decode", self._decode),
+            ("vad", self._trim),
+            ("features", self._extract_features),
+            ("transcribe", self._transcribe),
+            ("classify", self._classify),
+        ]
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(stages))]
+        results: asyncio.Queue = asyncio.Queue()
+        outboxes = queues[1:] + [results]
+
+        stage_groups = []
+        for (name, body), inbox, outbox in zip(stages, queues, outboxes):
+            workers = [
+                asyncio.create_task(self._run_stage(name, body, inbox, outbox))
+                for _ in range(self.stage_workers[name])
+            ]
+            stage_groups.append(workers)
+
+        async def feed() -> None:
+            for index, audio_data in enumerate(audio_data_list):
+                await queues[0].put(_ClipJob(index, audio_data, language, dict(user_info), speculative, deadline))
+            await queues[0].put(_DONE)
+
+        async def drain() -> None:
+            # Close each stage once all of its workers have exited
+            for workers, outbox in zip(stage_groups, outboxes):
+                await asyncio.gather(*workers)
+                await outbox.put(_DONE)
+
+        feeder = asyncio.create_task(feed())
+        closer = asyncio.create_task(drain())
+        finished = False
+        try:
+            while True:
+                job = await results.get()
+                if job is _DONE:
+                    finished = True
+                    break
+                yield job.result
+        finally:
+            if not finished:
+                deadline.cancel()
+            for task in [feeder, closer] + [w for group in stage_groups for w in group]:
+                task.cancel()
+
+    async def batch_analyze(
+        self,
+        audio_data_list: List[AudioSource],
+        language: str = "en",
+        user_info: Optional[Dict[str, Any]] = None,
+        speculative: bool = False,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Dict[str, Any]]:
+        """Analyze several clips through the pipeline; results are returned in input order"""
+        results = [
+            result async for result in self.stream_batch(audio_data_list, language, user_info, speculative, deadline)
+        ]
+        return sorted(results, key=lambda r: r["index"])
+
+    async def analyze_voice_symptoms(
+        self,
+        audio_data: AudioSource,
+        language: str = "en",
+        user_info: Optional[Dict[str, Any]] = None,
+        speculative: bool = False,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """Analyze a single clip: transcribe, classify and triage"""
+        results = await self.batch_analyze(
+            [audio_data], language=language, user_info=user_info, speculative=speculative, deadline=deadline
+        )
+        return results[0]
+
+    def get_supported_languages(self) -> Dict[str, str]:
+        return self.whisper.get_supported_languages()
+
+    def health_check(self) -> Dict[str, Any]:
+        whisper_health = self.whisper.health_check()
+        analyzer_health = {
+            "status": "healthy",
+            "model_loaded": self.text_models.current() is not None,
+            "model_version": self.text_models.status()["active"]["version"],
+        }
+        overall = "healthy"
+        if whisper_health.get("status") != "healthy" or analyzer_health["status"] != "healthy":
+            overall = "degraded" if whisper_health.get("status") == "degraded" else "unhealthy"
+        return {
+            "whisper": whisper_health,
+            "symptom_analyzer": analyzer_health,
+            "pipeline": {
+                "stage_workers": self.stage_workers,
+                "stage_batch": self.stage_batch,
+                "queue_size": self.queue_size,
+                "vad_enabled": self.vad_enabled,
+            },
+            "overall": overall,
+        }
@@ -7,52 +7,153 @@ import os
 import io
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, BinaryIO, Union
 import torch
 import torchaudio
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
+from transformers import StoppingCriteria, StoppingCriteriaList, WhisperProcessor, WhisperForConditionalGeneration
 import numpy as np
 import librosa
 from pydub import AudioSegment
 
+from .autotune import apply_tuned_threads
+from .deadline import Deadline, wasted_work
+from .log_mel import LogMelExtractor
+from .profiler import profile_stage
+
 logger = logging.getLogger(__name__)
 
+# Encoded audio: raw bytes or a seekable binary file (e.g. a spooled upload)
+AudioSource = Union[bytes, BinaryIO]
+
+
+def _peak_normalize(audio: np.ndarray) -> np.ndarray:
+    """Scale to unit peak as float32, in place (no abs() temporary)"""
+    audio = np.asarray(audio, dtype=np.float32)
+    peak = max(float(audio.max()), -float(audio.min())) if audio.size else 0.0
+    if peak > 0:
+        audio *= 1.0 / peak
+    return audio
+
+
+class DeadlineStoppingCriteria(StoppingCriteria):
+    """Stops generation once every request in the batch has passed its deadline or disconnected"""
+
+    def __init__(self, deadlines: List[Deadline]) -> None:
+        self.deadlines = deadlines
+        self.fired = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        stop = all(d.expired() for d in self.deadlines)
+        if stop and not self.fired:
+            self.fired = True
+            wasted_work.generate_stopped += 1
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
 
 class WhisperIntegrationService:
     """Service for integrating with Whisper model for voice-to-text conversion"""
     
     _instance: Optional["WhisperIntegrationService"] = None
     
-    def __init__(self):
+    BACKENDS = ("torch", "int8", "onnx")
+    
+    def __init__(self, backend: Optional[str] = None):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # torch: fp32 transformers model; int8: dynamic-quantized Linear layers (CPU);
+        # onnx: onnxruntime encoder/decoder with KV-cache exported by optimize_whisper.py
+        self.backend = (backend or os.environ.get("WHISPER_BACKEND", "torch")).lower()
+        self.model_name = None
         self.model = None
         self.processor = None
+        self.draft_model = None
+        # Batched torch log-mel extractor (WHISPER_TORCH_FEATURES=0 falls back to the processor)
+        self.log_mel: Optional[LogMelExtractor] = None
         self._load_model()
     
     @classmethod
     def get_instance(cls) -> "WhisperIntegrationService":
         if cls._instance is None:
+            apply_tuned_threads()
             cls._instance = WhisperIntegrationService()
         return cls._instance
     
     def _load_model(self):
         """Load Whisper model and processor"""
         try:
+            if self.backend not in self.BACKENDS:
+                raise ValueError(f"Unknown WHISPER_BACKEND '{self.backend}', expected one of {self.BACKENDS}")
+            
             # You can replace this with your team's specific model path
             model_name = os.environ.get("WHISPER_MODEL", "openai/whisper-base")
             
-            logger.info(f"Loading Whisper model: {model_name}")
-            self.processor = WhisperProcessor.from_pretrained(model_name)
-            self.model = WhisperForConditionalGeneration.from_pretrained(model_name)
-            self.model.to(self.device)
-            self.model.eval()
+            if self.backend == "onnx":
+                self._load_onnx_model(model_name)
+            else:
+                logger.info(f"Loading Whisper model: {model_name}")
+                self.processor = WhisperProcessor.from_pretrained(model_name)
+                self.model = WhisperForConditionalGeneration.from_pretrained(model_name)
+                self.model_name = model_name
+                if self.backend == "int8":
+                    self._quantize_int8()
+                self.model.to(self.device)
+                self.model.eval()
+                self._load_draft_model()
             
-            logger.info("Whisper model loaded successfully")
+            if os.environ.get("WHISPER_TORCH_FEATURES", "1") == "1":
+                self.log_mel = LogMelExtractor.from_feature_extractor(self.processor.feature_extractor, device=self.device)
+            
+            logger.info(f"Whisper model loaded successfully (backend={self.backend})")
         except Exception as e:
             logger.warning(f"Failed to load Whisper model: {e}")
             logger.warning("Whisper model will be disabled. Voice analysis will use mock transcription.")
             self.model = None
             self.processor = None
+            self.log_mel = None
+    
+    def _load_draft_model(self):
+        """Load the optional small Whisper checkpoint used to draft tokens for speculative decoding"""
+        draft_path = os.environ.get("WHISPER_DRAFT_MODEL")
+        if not draft_path:
+            return
+        try:
+            if not os.path.exists(draft_path):
+                raise FileNotFoundError(f"Draft model not found at {draft_path}")
+            logger.info(f"Loading Whisper draft model: {draft_path}")
+            self.draft_model = WhisperForConditionalGeneration.from_pretrained(draft_path)
+            self.draft_model.to(self.device)
+            self.draft_model.eval()
+        except Exception as e:
+            logger.warning(f"Failed to load Whisper draft model: {e}; speculative decoding disabled")
+            self.draft_model = None
+    
+    def _quantize_int8(self):
+        """Dynamic int8 quantization of the Linear layers (CPU only)"""
+        if self.device != "cpu":
+            logger.warning("int8 Whisper backend is CPU-only; keeping fp32 weights on GPU")
+            self.backend = "torch"
+            return
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+    
+    def _load_onnx_model(self, model_name: str):
+        """Load an ONNX-exported encoder/decoder (with KV-cache) through optimum's onnxruntime wrapper"""
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        
+        onnx_path = os.environ.get(
+            "WHISPER_ONNX_PATH",
+            os.path.join(os.path.dirname(__file__), "..", "..", "models", "optimized", "whisper_onnx"),
+        )
+        if os.path.exists(onnx_path):
+            logger.info(f"Loading ONNX Whisper model: {onnx_path}")
+            self.processor = WhisperProcessor.from_pretrained(onnx_path)
+            self.model = ORTModelForSpeechSeq2Seq.from_pretrained(onnx_path, use_cache=True)
+            self.model_name = onnx_path
+        else:
+            logger.warning(f"No ONNX export at {onnx_path}; exporting {model_name} on the fly (run optimize_whisper.py to cache it)")
+            self.processor = WhisperProcessor.from_pretrained(model_name)
+            self.model = ORTModelForSpeechSeq2Seq.from_pretrained(model_name, export=True, use_cache=True)
+            self.model_name = model_name
+        # onnxruntime sessions here run on the CPU execution provider
+        self.device = "cpu"
     
     async def transcribe_audio(self, audio_data: bytes, language: str = "en") -> Dict[str, Any]:
         """
@@ -73,56 +174,126 @@ class WhisperIntegrationService:
         try:
             # Convert bytes to audio tensor
             logger.info(f"Processing audio data: {len(audio_data)} bytes")
-            audio_tensor = self._bytes_to_audio_tensor(audio_data)
+            audio_tensor = self.decode_audio(audio_data)
             logger.info(f"Audio tensor shape: {audio_tensor.shape}, type: {type(audio_tensor)}")
             
+            input_features = self.extract_features(audio_tensor)
+            return self.generate_transcription(input_features, language)
+            
+        except Exception as e:
+            logger.error(f"Transcription failed: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "transcription": "",
+                "language": language
+            }
+    
+    def decode_audio(self, audio_data: AudioSource) -> np.ndarray:
+        """Decode audio bytes or a binary file to a normalized 16kHz mono waveform (CPU bound)"""
+        with profile_stage("whisper.decode_audio"):
+            return self._bytes_to_audio_tensor(audio_data)
+    
+    def extract_features(self, audio_array: np.ndarray) -> torch.Tensor:
+        """Compute Whisper log-mel input features for a decoded waveform"""
+        return self.extract_features_batch([audio_array])
+    
+    def extract_features_batch(self, audio_arrays: List[np.ndarray], max_batch: int = 8) -> torch.Tensor:
+        """Log-mel input features for several waveforms, shape (batch, n_mels, frames)"""
+        with profile_stage("whisper.features"):
+            if self.log_mel is not None:
+                return self.log_mel.extract(audio_arrays, max_batch=max_batch).to(self.device)
             # Process audio - force English translation regardless of input language
             inputs = self.processor(
-                audio_tensor, 
+                audio_arrays, 
                 sampling_rate=16000, 
                 return_tensors="pt",
                 language="en"  # Force English output
             )
-            
-            # Move to device
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Generate transcription with forced English translation
-            with torch.no_grad():
-                generated_ids = self.model.generate(
-                    inputs["input_features"],
-                    max_length=448,
-                    num_beams=5,
-                    early_stopping=True,
-                    forced_decoder_ids=self.processor.get_decoder_prompt_ids(
-                        language="en", 
-                        task="translate"  # Force translation to English
-                    )
-                )
-            
+            return inputs["input_features"].to(self.device)
+    
+    def generate_ids(
+        self,
+        input_features: torch.Tensor,
+        speculative: bool = False,
+        num_beams: Optional[int] = None,
+        deadlines: Optional[List[Deadline]] = None,
+    ) -> torch.Tensor:
+        """
+        Run Whisper generation and return the token ids
+        
+        With ``speculative=True`` and a draft model loaded, the draft proposes tokens
+        and the main model verifies them (assisted generation). Assisted generation is
+        greedy, so the output is identical to greedy decoding with the main model while
+        the main decoder runs fewer sequential steps.
+        
+        With ``deadlines``, generation stops early (with a truncated output) once all of
+        them have expired.
+        """
+        # Force translation to English
+        kwargs = {
+            "max_length": 448,
+            "forced_decoder_ids": self.processor.get_decoder_prompt_ids(language="en", task="translate"),
+        }
+        if speculative and self.draft_model is not None:
+            kwargs.update(assistant_model=self.draft_model, num_beams=1)
+        else:
+            kwargs.update(num_beams=num_beams or 5, early_stopping=True)
+        if deadlines:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([DeadlineStoppingCriteria(deadlines)])
+        
+        with torch.no_grad(), profile_stage("whisper.generate"):
+            return self.model.generate(input_features, **kwargs)
+    
+    def generate_transcription(
+        self,
+        input_features: torch.Tensor,
+        language: str = "en",
+        speculative: bool = False,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """Run Whisper generation on precomputed input features"""
+        deadlines = [deadline] if deadline is not None else None
+        return self.generate_transcriptions(input_features, language, speculative=speculative, deadlines=deadlines)[0]
+    
+    def generate_transcriptions(
+        self,
+        input_features: torch.Tensor,
+        language: str = "en",
+        speculative: bool = False,
+        deadlines: Optional[List[Deadline]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Run Whisper generation for a batch of input features, one result per row (one deadline per row)"""
+        if self.model is None or self.processor is None:
+            rows = 1 if input_features is None else len(input_features)
+            return [self._mock_transcription(language) for _ in range(rows)]
+        
+        speculative = speculative and self.draft_model is not None
+        # Generate transcription with forced English translation
+        if speculative:
+            # Assisted generation only supports batch size 1
+            generated = [
+                self.generate_ids(row.unsqueeze(0), speculative=True, deadlines=[deadlines[i]] if deadlines else None)
+                for i, row in enumerate(input_features)
+            ]
+            transcriptions = [self.processor.batch_decode(ids, skip_special_tokens=True)[0] for ids in generated]
+        else:
+            generated_ids = self.generate_ids(input_features, deadlines=deadlines)
             # Decode transcription
-            transcription = self.processor.batch_decode(
-                generated_ids, 
-                skip_special_tokens=True
-            )[0]
-            
-            return {
+            transcriptions = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+        
+        return [
+            {
                 "success": True,
                 "transcription": transcription.strip(),
                 "language": "en",  # Always English output
                 "confidence": 1.0,  # Whisper doesn't provide confidence scores directly
                 "model": "whisper",
-                "translated": True  # Indicate this was translated to English
-            }
-            
-        except Exception as e:
-            logger.error(f"Transcription failed: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "transcription": "",
-                "language": language
+                "translated": True,  # Indicate this was translated to English
+                "speculative": speculative
             }
+            for transcription in transcriptions
+        ]
     
     def _mock_transcription(self, language: str) -> Dict[str, Any]:
         """Provide mock transcription when Whisper is not available"""
@@ -140,10 +311,14 @@ class WhisperIntegrationService:
             "note": "Whisper model not available, using mock transcription"
         }
     
-    def _bytes_to_audio_tensor(self, audio_data: bytes) -> torch.Tensor:
-        """Convert audio bytes to tensor"""
+    def _bytes_to_audio_tensor(self, audio_data: AudioSource) -> torch.Tensor:
+        """Convert audio bytes (or a seekable file, read in place without copying) to tensor"""
         try:
-            audio_buffer = io.BytesIO(audio_data)
+            if isinstance(audio_data, (bytes, bytearray, memoryview)):
+                audio_buffer = io.BytesIO(audio_data)
+            else:
+                audio_buffer = audio_data
+                audio_buffer.seek(0)
             
             # First try librosa (better M4A support)
             try:
@@ -152,8 +327,7 @@ class WhisperIntegrationService:
                 logger.info(f"Librosa success: shape={audio_array.shape}, sr={sample_rate}")
                 
                 # Normalize
-                if np.max(np.abs(audio_array)) > 0:
-                    audio_array = audio_array / np.max(np.abs(audio_array))
+                audio_array = _peak_normalize(audio_array)
                 
                 return audio_array
             except Exception as librosa_error:
@@ -169,8 +343,7 @@ class WhisperIntegrationService:
                 # Convert to numpy array
                 audio_array = np.array(audio_segment.get_array_of_samples(), dtype=np.float32)
                 # Normalize
-                if np.max(np.abs(audio_array)) > 0:
-                    audio_array = audio_array / np.max(np.abs(audio_array))
+                audio_array = _peak_normalize(audio_array)
                 logger.info(f"Pydub success: shape={audio_array.shape}")
                 return audio_array
             except Exception as pydub_error:
@@ -208,8 +381,7 @@ class WhisperIntegrationService:
             audio_array = waveform.squeeze().numpy()
             
             # Normalize
-            if np.max(np.abs(audio_array)) > 0:
-                audio_array = audio_array / np.max(np.abs(audio_array))
+            audio_array = _peak_normalize(audio_array)
             
             logger.info(f"Audio processed: shape={audio_array.shape}, sample_rate=16000")
             return audio_array
@@ -267,7 +439,9 @@ class WhisperIntegrationService:
                 "status": "healthy",
                 "model_loaded": True,
                 "device": self.device,
-                "model_name": "whisper-base"
+                "model_name": self.model_name,
+                "backend": self.backend,
+                "speculative_available": self.draft_model is not None
             }
         except Exception as e:
             return {"status": "unhealthy", "error": str(e)}
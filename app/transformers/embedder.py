@@ -5,6 +5,9 @@ import torch
 import numpy as np
 from transformers import AutoTokenizer, AutoModel
 
+from ..services.autotune import apply_tuned_threads
+from ..services.compiled import BucketedModel
+
 
 _MODEL_NAME = "microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract-fulltext"
 
@@ -26,10 +29,13 @@ class PubMedBERTEmbedder:
         self.model = AutoModel.from_pretrained(model_name)
         self.model.to(self.device)
         self.model.eval()
+        # Opt-in length-bucketed compiled mode (COMPILE_MODE), buckets up to the default max_length
+        self.compiled = BucketedModel.from_env(self.model, "last_hidden_state", 128, self.tokenizer.pad_token_id or 0)
 
     @classmethod
     def get_instance(cls) -> "PubMedBERTEmbedder":
         if cls._instance is None:
+            apply_tuned_threads()
             cls._instance = PubMedBERTEmbedder()
         return cls._instance
 
@@ -43,6 +49,9 @@ class PubMedBERTEmbedder:
                 return_tensors="pt",
             )
             batch = {k: v.to(self.device) for k, v in batch.items()}
-            outputs = self.model(**batch)
-            pooled = _mean_pool(outputs.last_hidden_state, batch["attention_mask"])  # (B, D)
+            if self.compiled is not None:
+                hidden = self.compiled(batch)
+            else:
+                hidden = self.model(**batch).last_hidden_state
+            pooled = _mean_pool(hidden, batch["attention_mask"])  # (B, D)
             return pooled.cpu().numpy()
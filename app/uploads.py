@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, List, Optional
+import io
+import os
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _env_mb(name: str, default: float) -> int:
+    return int(float(os.environ.get(name, default)) * 1024 * 1024)
+
+
+def max_file_bytes() -> int:
+    return _env_mb("UPLOAD_MAX_FILE_MB", 25)
+
+
+def max_request_bytes() -> int:
+    return _env_mb("UPLOAD_MAX_REQUEST_MB", 100)
+
+
+def _too_large(what: str, limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{what} exceeds the {limit / (1024 * 1024):g} MB limit")
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies over UPLOAD_MAX_REQUEST_MB on upload routes with 413.
+
+    A declared Content-Length is checked before anything is read; chunked bodies are
+    counted as they stream in. Uploaded files themselves are spooled to disk past
+    1 MB by the multipart parser, so memory stays bounded either way.
+    """
+
+    def __init__(self, app, path_prefixes: tuple = ("/analyze-voice",)) -> None:
+        self.app = app
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        limit = max_request_bytes()
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            error = _too_large("Request body", limit)
+            await JSONResponse({"detail": error.detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes a 413
+                    raise _too_large("Request body", limit)
+            return message
+
+        await self.app(scope, counting_receive, send)
+
+
+def _size(file: BinaryIO) -> int:
+    position = file.tell()
+    file.seek(0, io.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def upload_file(upload: UploadFile, detach: bool = False) -> BinaryIO:
+    """
+    The upload's spooled file, rewound and size-checked, for decoding without reading it into memory.
+
+    FastAPI closes form files when the endpoint returns, before a StreamingResponse body
+    runs; with ``detach`` the caller takes ownership of the file and must close it.
+    """
+    if not (upload.content_type or "").startswith("audio/"):
+        raise HTTPException(status_code=400, detail=f"File {upload.filename} must be an audio file")
+    file = upload.file
+    size = upload.size if upload.size is not None else _size(file)
+    if size == 0:
+        raise HTTPException(status_code=400, detail=f"Empty audio file: {upload.filename}")
+    if size > max_file_bytes():
+        raise _too_large(f"File {upload.filename}", max_file_bytes())
+    file.seek(0)
+    if detach:
+        upload.file = io.BytesIO()
+    return file
+
+
+def upload_files(uploads: List[UploadFile], detach: bool = False) -> List[BinaryIO]:
+    """Files for a batch upload, with the per-request total checked after the per-file limits"""
+    files: List[BinaryIO] = []
+    try:
+        for upload in uploads:
+            files.append(upload_file(upload, detach=detach))
+        if sum(_size(file) for file in files) > max_request_bytes():
+            raise _too_large("Uploaded files", max_request_bytes())
+    except BaseException:
+        # Detached files are no longer reachable by FastAPI's form cleanup
+        if detach:
+            close_all(files)
+        raise
+    return files
+
+
+def download_audio(url: str, timeout: float) -> BinaryIO:
+    """Stream a remote audio file into a spooled temporary file, enforcing UPLOAD_MAX_FILE_MB"""
+    import requests
+
+    limit = max_file_bytes()
+    with requests.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            raise _too_large("Downloaded audio", limit)
+        spool = SpooledTemporaryFile(max_size=CHUNK_SIZE)
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                spool.write(chunk)
+                if spool.tell() > limit:
+                    raise _too_large("Downloaded audio", limit)
+        except BaseException:
+            spool.close()
+            raise
+    if spool.tell() == 0:
+        spool.close()
+        raise HTTPException(status_code=400, detail="Downloaded audio file is empty")
+    spool.seek(0)
+    return spool
+
+
+def close_all(files: Optional[List[BinaryIO]]) -> None:
+    for file in files or []:
+        file.close()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the voice and text inference paths
+- vad: silence trimming - audio removed, latency saved and transcript agreement on a local corpus
+- whisper: Whisper backends (torch fp32 / int8 / onnx) - load time, latency and agreement with fp32
+- speculative: draft-model assisted Whisper decoding vs. greedy - tokens/sec, decoder steps, exact match
+- features: batched torch log-mel extraction vs. WhisperProcessor per clip - ms/clip and max difference
+- compiled: length-bucketed torch.compile / TorchScript vs. eager for BioBERT or PubMedBERT - latency and speedup
+"""
+
+import os
+import time
+import argparse
+import statistics
+from typing import List
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".mp4", ".flac", ".ogg", ".webm")
+
+
+def _list_audio(corpus_dir: str, limit: int = 0) -> List[str]:
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(corpus_dir)
+        for name in files
+        if name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def word_agreement(reference: str, hypothesis: str) -> float:
+    """1 - word error rate, clipped at 0"""
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 1.0 if not hyp else 0.0
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return max(0.0, 1.0 - prev[-1] / len(ref))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _latency_summary(seconds: List[float]) -> dict:
+    return {
+        "latency_ms_mean": round(statistics.mean(seconds) * 1000, 1),
+        "latency_ms_p50": round(_percentile(seconds, 0.5) * 1000, 1),
+        "latency_ms_p95": round(_percentile(seconds, 0.95) * 1000, 1),
+    }
+
+
+def _load_corpus_audio(whisper, args) -> List:
+    paths = _list_audio(args.corpus, args.limit)
+    if not paths:
+        print(f"❌ No audio files found under {args.corpus}")
+    clips = []
+    for path in paths:
+        with open(path, "rb") as f:
+            clips.append(whisper.decode_audio(f.read()))
+    return clips
+
+
+def _timed_transcribe(whisper, audio) -> tuple:
+    start = time.perf_counter()
+    features = whisper.extract_features(audio)
+    result = whisper.generate_transcription(features)
+    return result.get("transcription", ""), time.perf_counter() - start
+
+
+def bench_vad(args) -> None:
+    from app.services.whisper_integration import WhisperIntegrationService
+    from app.services.vad import trim_silence
+
+    whisper = WhisperIntegrationService.get_instance()
+    if whisper.model is None:
+        print("❌ Whisper model not available")
+        return
+
+    paths = _list_audio(args.corpus, args.limit)
+    if not paths:
+        print(f"❌ No audio files found under {args.corpus}")
+        return
+
+    removed, saved, agreement = [], [], []
+    for path in paths:
+        with open(path, "rb") as f:
+            audio = whisper.decode_audio(f.read())
+        trimmed, stats = trim_silence(audio, threshold_db=args.threshold_db)
+
+        full_text, full_time = _timed_transcribe(whisper, audio)
+        trimmed_text, trimmed_time = _timed_transcribe(whisper, trimmed)
+
+        removed.append(stats["removed_fraction"])
+        saved.append(full_time - trimmed_time)
+        agreement.append(word_agreement(full_text, trimmed_text))
+        print({
+            "file": os.path.basename(path),
+            "removed_fraction": stats["removed_fraction"],
+            "full_ms": round(full_time * 1000, 1),
+            "trimmed_ms": round(trimmed_time * 1000, 1),
+            "agreement": round(agreement[-1], 3),
+        })
+
+    print({
+        "files": len(paths),
+        "removed_fraction_mean": round(statistics.mean(removed), 4),
+        "latency_saved_ms_mean": round(statistics.mean(saved) * 1000, 1),
+        "transcript_agreement_mean": round(statistics.mean(agreement), 4),
+        "transcript_agreement_min": round(min(agreement), 4),
+    })
+
+
+def bench_whisper(args) -> None:
+    from app.services.whisper_integration import WhisperIntegrationService
+
+    clips = None
+    reference = None
+    for backend in args.backends:
+        start = time.perf_counter()
+        whisper = WhisperIntegrationService(backend=backend)
+        load_time = time.perf_counter() - start
+        if whisper.model is None:
+            print({"backend": backend, "error": "model failed to load"})
+            continue
+        if clips is None:
+            clips = _load_corpus_audio(whisper, args)
+            if not clips:
+                return
+
+        texts, times = [], []
+        for audio in clips:
+            text, elapsed = _timed_transcribe(whisper, audio)
+            texts.append(text)
+            times.append(elapsed)
+        if reference is None:
+            # The first backend (torch fp32 by default) is the accuracy reference
+            reference = texts
+
+        print({
+            "backend": backend,
+            "files": len(clips),
+            "load_s": round(load_time, 2),
+            **_latency_summary(times),
+            "agreement_vs_" + args.backends[0]: round(
+                statistics.mean(word_agreement(r, t) for r, t in zip(reference, texts)), 4
+            ),
+        })
+
+
+def bench_speculative(args) -> None:
+    from app.services.whisper_integration import WhisperIntegrationService
+
+    whisper = WhisperIntegrationService.get_instance()
+    if whisper.model is None or whisper.draft_model is None:
+        print("❌ Whisper model and WHISPER_DRAFT_MODEL are both required")
+        return
+    clips = _load_corpus_audio(whisper, args)
+    if not clips:
+        return
+
+    # Count sequential forward passes of the main decoder
+    decoder_calls = [0]
+    hook = whisper.model.model.decoder.register_forward_hook(
+        lambda *_: decoder_calls.__setitem__(0, decoder_calls[0] + 1)
+    )
+    stats = {mode: {"tokens": 0, "seconds": 0.0, "decoder_calls": 0} for mode in ("greedy", "speculative")}
+    matches = 0
+    try:
+        for audio in clips:
+            features = whisper.extract_features(audio)
+            outputs = {}
+            for mode in ("greedy", "speculative"):
+                decoder_calls[0] = 0
+                start = time.perf_counter()
+                ids = whisper.generate_ids(features, speculative=(mode == "speculative"), num_beams=1)
+                stats[mode]["seconds"] += time.perf_counter() - start
+                stats[mode]["tokens"] += int(ids.shape[-1])
+                stats[mode]["decoder_calls"] += decoder_calls[0]
+                outputs[mode] = ids[0].tolist()
+            matches += outputs["greedy"] == outputs["speculative"]
+    finally:
+        hook.remove()
+
+    for mode, s in stats.items():
+        print({
+            "mode": mode,
+            "files": len(clips),
+            "tokens_per_sec": round(s["tokens"] / s["seconds"], 1) if s["seconds"] else 0.0,
+            "decoder_calls": s["decoder_calls"],
+            "seconds": round(s["seconds"], 2),
+        })
+    print({"exact_match": f"{matches}/{len(clips)}"})
+
+
+def bench_features(args) -> None:
+    import numpy as np
+    from transformers import WhisperFeatureExtractor
+    from app.services.log_mel import LogMelExtractor
+
+    try:
+        feature_extractor = WhisperFeatureExtractor.from_pretrained(os.environ.get("WHISPER_MODEL", "openai/whisper-base"))
+    except Exception:
+        # Whisper's log-mel settings are the same for every checkpoint except large-v3 (128 mels)
+        feature_extractor = WhisperFeatureExtractor()
+
+    if args.corpus:
+        import librosa
+
+        clips = [librosa.load(path, sr=16000, mono=True)[0] for path in _list_audio(args.corpus, args.limit)]
+        if not clips:
+            print(f"❌ No audio files found under {args.corpus}")
+            return
+    else:
+        rng = np.random.default_rng(0)
+        seconds = rng.uniform(args.min_seconds, args.max_seconds, args.clips)
+        clips = [rng.standard_normal(int(16000 * s)).astype(np.float32) * 0.1 for s in seconds]
+
+    def processor_path():
+        return np.concatenate([
+            feature_extractor(clip, sampling_rate=16000, return_tensors="np")["input_features"] for clip in clips
+        ])
+
+    extractor = LogMelExtractor.from_feature_extractor(feature_extractor)
+    reference = processor_path()
+    timings = {"processor_per_clip": processor_path}
+    for batch in args.batch_sizes:
+        timings[f"torch_batch_{batch}"] = lambda batch=batch: extractor.extract(clips, max_batch=batch).numpy()
+
+    for name, run in timings.items():
+        features = run()  # warm-up; also the output compared with the processor
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            run()
+        elapsed = (time.perf_counter() - start) / args.repeats
+        print({
+            "path": name,
+            "clips": len(clips),
+            "ms_per_clip": round(elapsed / len(clips) * 1000, 2),
+            "max_abs_diff": float(np.abs(features - reference).max()),
+        })
+
+
+def bench_compiled(args) -> None:
+    import numpy as np
+    from app.services.autotune import synthetic_texts
+    from app.services.compiled import BucketedModel
+
+    os.environ["COMPILE_MODE"] = "off"  # load eager; each mode is attached below
+    if args.target == "biobert":
+        from app.services.biobert_infer import BioBERTInferenceService
+
+        service = BioBERTInferenceService(model_path=args.model_path)
+        output, max_length = "logits", service.MAX_LENGTH
+        run = lambda texts: service._probabilities(texts).numpy()
+    else:
+        from app.transformers.embedder import PubMedBERTEmbedder
+
+        service = PubMedBERTEmbedder()
+        output, max_length = "last_hidden_state", 128
+        run = service.embed_texts
+
+    buckets = args.buckets or None
+    texts = synthetic_texts(max(args.batch_sizes) * args.repeats, seed=1)
+    baseline = {}
+    for mode in ["eager"] + args.modes:
+        if mode == "eager":
+            service.compiled = None
+            compile_s = {}
+        else:
+            service.compiled = BucketedModel(
+                service.model, output, max_length, service.tokenizer.pad_token_id or 0, mode=mode, buckets=buckets
+            )
+            compile_s = service.compiled.warmup()
+        for batch in args.batch_sizes:
+            batches = [texts[i * batch:(i + 1) * batch] for i in range(args.repeats)]
+            outputs, seconds = [], []
+            run(batches[0])  # warm-up
+            for chunk in batches:
+                start = time.perf_counter()
+                outputs.append(run(chunk))
+                seconds.append(time.perf_counter() - start)
+            summary = _latency_summary(seconds)
+            if mode == "eager":
+                baseline[batch] = (summary, outputs)
+            eager_summary, eager_outputs = baseline[batch]
+            print({
+                "mode": mode,
+                "batch": batch,
+                **summary,
+                "speedup_p50": round(eager_summary["latency_ms_p50"] / max(summary["latency_ms_p50"], 1e-3), 2),
+                "max_abs_diff": float(max(np.abs(a - b).max() for a, b in zip(outputs, eager_outputs))),
+                "compile_s": sum(compile_s.values()),
+            })
+        if service.compiled is not None:
+            print({"mode": mode, "eager_fallback_calls": service.compiled.eager_calls})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    vad = sub.add_parser("vad", help="Silence trimming: audio removed, latency saved, transcript agreement")
+    vad.add_argument("--corpus", required=True, help="Directory of local test recordings")
+    vad.add_argument("--limit", type=int, default=0, help="Max files to process (0 = all)")
+    vad.add_argument("--threshold_db", type=float, default=-40.0)
+    vad.set_defaults(func=bench_vad)
+
+    whisper = sub.add_parser("whisper", help="Whisper backends: load time, latency, agreement with the first backend")
+    whisper.add_argument("--corpus", required=True, help="Directory of local test recordings")
+    whisper.add_argument("--limit", type=int, default=0, help="Max files to process (0 = all)")
+    whisper.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    whisper.set_defaults(func=bench_whisper)
+
+    spec = sub.add_parser("speculative", help="Speculative vs. greedy Whisper decoding on CPU")
+    spec.add_argument("--corpus", required=True, help="Directory of local test recordings")
+    spec.add_argument("--limit", type=int, default=0, help="Max files to process (0 = all)")
+    spec.set_defaults(func=bench_speculative)
+
+    feats = sub.add_parser("features", help="Batched torch log-mel vs. WhisperProcessor: ms/clip and max difference")
+    feats.add_argument("--corpus", default=None, help="Directory of recordings (default: synthetic clips)")
+    feats.add_argument("--limit", type=int, default=0, help="Max files to process (0 = all)")
+    feats.add_argument("--clips", type=int, default=32, help="Synthetic clips to generate")
+    feats.add_argument("--min_seconds", type=float, default=2.0)
+    feats.add_argument("--max_seconds", type=float, default=30.0)
+    feats.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 4, 8])
+    feats.add_argument("--repeats", type=int, default=3)
+    feats.set_defaults(func=bench_features)
+
+    comp = sub.add_parser("compiled", help="Length-bucketed compiled modes vs. eager: latency and speedup")
+    comp.add_argument("--target", choices=["biobert", "embedder"], default="biobert")
+    comp.add_argument("--model_path", default=None, help="BioBERT model directory (default: MODEL_PATH)")
+    comp.add_argument("--modes", nargs="+", choices=["trace", "compile"], default=["trace", "compile"])
+    comp.add_argument("--buckets", nargs="+", type=int, default=None, help="Length buckets (default: COMPILE_BUCKETS)")
+    comp.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 8])
+    comp.add_argument("--repeats", type=int, default=30)
+    comp.set_defaults(func=bench_compiled)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
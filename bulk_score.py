@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Offline bulk scoring of archived transcripts
+- Streams a CSV/JSONL file through BioBERTInferenceService (and optionally map_triage)
+- Length-bucketed batches spread across worker processes
+- Results appended to the output file; a checkpoint lets a killed job resume where it stopped
+
+Example:
+    PYTHONPATH=. python bulk_score.py --input archive.csv --output scored.jsonl --workers 4 --triage
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import pandas as pd
+
+from app.services.autotune import load_config, tuned_batch
+from training.data_prep import read_blocks
+
+_service = None
+
+
+def _init_worker(model_path: Optional[str], threads: int) -> None:
+    global _service
+    import torch
+    from app.services.biobert_infer import BioBERTInferenceService
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _service = BioBERTInferenceService(model_path=model_path)
+
+
+def _score_batch(args) -> List:
+    texts, top_k = args
+    return _service.predict_batch(texts, top_k=top_k)
+
+
+def bucketed_batches(texts: List[str], batch_size: int) -> List[List[int]]:
+    """Group row positions of similar length so each batch pads as little as possible"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class Checkpoint:
+    """Rows completed and the output size at that point; written atomically after each block"""
+
+    def __init__(self, output_path: str, input_path: str) -> None:
+        self.path = f"{output_path}.checkpoint.json"
+        self.input_path = os.path.abspath(input_path)
+        self.rows_done = 0
+        self.output_bytes = 0
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            if state["input"] != self.input_path:
+                raise RuntimeError(f"{self.path} belongs to {state['input']}; choose another --output")
+            self.rows_done = state["rows_done"]
+            self.output_bytes = state["output_bytes"]
+
+    def save(self, rows_done: int, output_bytes: int) -> None:
+        self.rows_done, self.output_bytes = rows_done, output_bytes
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"input": self.input_path, "rows_done": rows_done, "output_bytes": output_bytes}, f)
+        os.replace(tmp, self.path)
+
+
+def _records(block: pd.DataFrame, start_row: int, results: List, args) -> List[Dict]:
+    from app.triage.rules import map_triage
+
+    records = []
+    for offset, (row, preds) in enumerate(zip(block.to_dict("records"), results)):
+        record = {"row": start_row + offset}
+        if args.id_column:
+            record["id"] = row.get(args.id_column)
+        record["predictions"] = [
+            {"disease": disease, "confidence": confidence, "treatment": treatment}
+            for disease, confidence, treatment in preds
+        ]
+        if args.triage:
+            age = row.get("age")
+            record["next_step"] = map_triage(
+                str(row[args.text_column]),
+                age=int(age) if isinstance(age, (int, float)) and age == age else None,
+                gender=row.get("gender"),
+            )
+        records.append(record)
+    return records
+
+
+def _write(out, records: List[Dict], csv_output: bool, write_header: bool) -> None:
+    if not csv_output:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return
+    flat = []
+    for record in records:
+        row = {k: v for k, v in record.items() if k != "predictions"}
+        for rank, pred in enumerate(record["predictions"], 1):
+            row[f"disease_{rank}"] = pred["disease"]
+            row[f"confidence_{rank}"] = pred["confidence"]
+        flat.append(row)
+    pd.DataFrame(flat).to_csv(out, header=write_header, index=False)
+
+
+def bulk_score(args) -> None:
+    checkpoint = Checkpoint(args.output, args.input)
+    csv_output = args.output.endswith(".csv")
+
+    # Drop anything written after the last checkpoint (a partially flushed block)
+    mode = "r+" if os.path.exists(args.output) else "w"
+    with open(args.output, mode, encoding="utf-8", newline="") as out:
+        out.truncate(checkpoint.output_bytes)
+        out.seek(checkpoint.output_bytes)
+        if checkpoint.rows_done:
+            print(f"Resuming after {checkpoint.rows_done} rows")
+
+        threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+        if args.workers == 1 and not args.threads_per_worker:
+            threads = (load_config() or {}).get("threads") or threads
+        if args.workers > 1:
+            pool = ProcessPoolExecutor(
+                args.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(args.model_path, threads),
+            )
+        else:
+            pool = None
+            _init_worker(args.model_path, threads)
+
+        def score(jobs):
+            if pool is None:
+                return [_score_batch(job) for job in jobs]
+            return list(pool.map(_score_batch, jobs))
+
+        started = time.perf_counter()
+        scored = 0
+        try:
+            for block in read_blocks(args.input, args.block_rows, skip_rows=checkpoint.rows_done):
+                texts = block[args.text_column].fillna("").astype(str).tolist()
+                batches = bucketed_batches(texts, args.batch_size)
+                batch_results = score([([texts[i] for i in batch], args.top_k) for batch in batches])
+
+                results: List = [None] * len(texts)
+                for batch, preds in zip(batches, batch_results):
+                    for i, pred in zip(batch, preds):
+                        results[i] = pred
+
+                records = _records(block, checkpoint.rows_done, results, args)
+                _write(out, records, csv_output, write_header=checkpoint.output_bytes == 0)
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save(checkpoint.rows_done + len(block), out.tell())
+
+                scored += len(block)
+                elapsed = time.perf_counter() - started
+                print({"rows_done": checkpoint.rows_done, "rows_per_sec": round(scored / elapsed, 1)})
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Scored {scored} rows in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.1f} rows/sec) -> {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="CSV or JSONL file of records")
+    parser.add_argument("--output", required=True, help="Output .jsonl or .csv (appended to on resume)")
+    parser.add_argument("--text_column", default="text")
+    parser.add_argument("--id_column", default=None, help="Column copied to each output record")
+    parser.add_argument("--model_path", default=None, help="Model directory (default: MODEL_PATH / models/symptom_disease_model)")
+    parser.add_argument("--triage", action="store_true", help="Add map_triage next_step (uses age/gender columns if present)")
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads_per_worker", type=int, default=None, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--batch_size", type=int, default=None, help="Texts per forward pass (default: autotuned throughput batch, else 64)")
+    parser.add_argument("--block_rows", type=int, default=5000, help="Rows per checkpoint")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"❌ Input not found at {args.input}")
+        sys.exit(1)
+    args.batch_size = args.batch_size or tuned_batch("biobert", "throughput_batch") or 64
+    bulk_score(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Whisper optimization for CPU deployment
+- Export encoder/decoder to ONNX with KV-cache (loaded with WHISPER_BACKEND=onnx)
+- Optionally int8 dynamic-quantize the exported ONNX graphs
+
+The int8 torch backend (WHISPER_BACKEND=int8) needs no conversion step; it is
+quantized at load time. Compare backends with: python benchmark.py whisper --corpus DIR
+"""
+
+import os
+import glob
+import shutil
+import argparse
+from transformers import WhisperProcessor
+
+
+def export_to_onnx(model_name: str, output_path: str):
+    """Export Whisper encoder/decoder (with past key values) to ONNX"""
+    from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+    print(f"Exporting {model_name} to ONNX...")
+    model = ORTModelForSpeechSeq2Seq.from_pretrained(model_name, export=True, use_cache=True)
+    processor = WhisperProcessor.from_pretrained(model_name)
+
+    os.makedirs(output_path, exist_ok=True)
+    model.save_pretrained(output_path)
+    processor.save_pretrained(output_path)
+    print(f"✅ ONNX Whisper model saved to {output_path}")
+
+
+def quantize_onnx(onnx_path: str, output_path: str):
+    """Dynamic int8 quantization of every exported ONNX graph"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print("Quantizing ONNX Whisper model to int8...")
+    shutil.copytree(onnx_path, output_path, dirs_exist_ok=True)
+    for graph in glob.glob(os.path.join(onnx_path, "*.onnx")):
+        target = os.path.join(output_path, os.path.basename(graph))
+        quantize_dynamic(graph, target, weight_type=QuantType.QInt8)
+        print(f"  - {os.path.basename(graph)}")
+    print(f"✅ int8 ONNX Whisper model saved to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL", "openai/whisper-base"))
+    parser.add_argument("--output", default="models/optimized/whisper_onnx")
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 copy to <output>_int8")
+    args = parser.parse_args()
+
+    export_to_onnx(args.model, args.output)
+    if args.quantize:
+        quantize_onnx(args.output, f"{args.output}_int8")
+
+    print("\n🎉 Whisper optimization complete!")
+    print("Serve with:")
+    print(f"  WHISPER_BACKEND=onnx WHISPER_ONNX_PATH={args.output}")
+    if args.quantize:
+        print(f"  WHISPER_BACKEND=onnx WHISPER_ONNX_PATH={args.output}_int8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Structured pruning of the BioBERT symptom classifier
+- Scores attention-head and FFN-neuron importance on data/Symptom2Disease.csv
+  (accumulated |gradient| of the loss w.r.t. head/neuron masks)
+- Removes the least important heads and neurons until the target encoder FLOP reduction is met
+- Optionally fine-tunes briefly to recover accuracy
+- Saves a checkpoint BioBERTInferenceService loads as-is, plus an accuracy/latency report
+
+Heads are pruned per layer (recorded in config.pruned_heads). FFN neurons are removed in
+equal numbers from every layer, so a single config.intermediate_size still describes the model.
+
+Example:
+    python prune_model.py --flop_reduction 0.4 --finetune_epochs 1
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import statistics
+from typing import Dict, List, Tuple
+import joblib
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.model_selection import train_test_split
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers.pytorch_utils import prune_linear_layer
+
+DATA_PATH = "data/Symptom2Disease.csv"
+FFN_STEPS = 48  # FFN neurons are removed per layer in 1/48 slices (64 for BERT-base)
+
+
+def load_data(model_path: str, eval_fraction: float, seed: int) -> Tuple[List[str], np.ndarray, List[str], np.ndarray]:
+    label_encoder_path = os.path.join(model_path, "label_encoder.pkl")
+    if not os.path.exists(label_encoder_path):
+        label_encoder_path = os.path.join("models", "label_encoder.pkl")
+    label_encoder = joblib.load(label_encoder_path)
+    df = pd.read_csv(DATA_PATH).dropna(subset=["Symptoms", "Disease"])
+    df = df[df["Disease"].isin(label_encoder.classes_)]
+    texts = df["Symptoms"].astype(str).tolist()
+    labels = label_encoder.transform(df["Disease"])
+    train_x, eval_x, train_y, eval_y = train_test_split(
+        texts, labels, test_size=eval_fraction, stratify=labels, random_state=seed
+    )
+    return train_x, np.asarray(train_y), eval_x, np.asarray(eval_y)
+
+
+def _batches(texts: List[str], labels: np.ndarray, tokenizer, batch_size: int, max_length: int = 256):
+    for i in range(0, len(texts), batch_size):
+        inputs = tokenizer(texts[i:i + batch_size], truncation=True, padding=True, max_length=max_length, return_tensors="pt")
+        yield inputs, torch.as_tensor(labels[i:i + batch_size], dtype=torch.long)
+
+
+def score_importance(model, tokenizer, texts: List[str], labels: np.ndarray, batch_size: int) -> Tuple[torch.Tensor, List[torch.Tensor]]:
+    """Accumulated |dLoss/dmask| per attention head (layers, heads) and per FFN neuron (per layer)"""
+    config = model.config
+    layers = model.bert.encoder.layer
+    head_mask = torch.ones(config.num_hidden_layers, config.num_attention_heads, requires_grad=True)
+    ffn_masks = [torch.ones(layer.intermediate.dense.out_features, requires_grad=True) for layer in layers]
+    hooks = [
+        layer.intermediate.register_forward_hook(lambda _m, _i, out, mask=mask: out * mask)
+        for layer, mask in zip(layers, ffn_masks)
+    ]
+    head_importance = torch.zeros_like(head_mask)
+    ffn_importance = [torch.zeros_like(mask) for mask in ffn_masks]
+
+    model.eval()  # no dropout noise in the scores
+    try:
+        for inputs, y in _batches(texts, labels, tokenizer, batch_size):
+            loss = model(**inputs, head_mask=head_mask, labels=y).loss
+            loss.backward()
+            head_importance += head_mask.grad.abs()
+            for total, mask in zip(ffn_importance, ffn_masks):
+                total += mask.grad.abs()
+                mask.grad = None
+            head_mask.grad = None
+            model.zero_grad()
+    finally:
+        for hook in hooks:
+            hook.remove()
+
+    # Per-layer L2 normalization of head scores (Michel et al., 2019)
+    head_importance /= head_importance.norm(dim=1, keepdim=True).clamp(min=1e-12)
+    return head_importance, ffn_importance
+
+
+def encoder_flops(config, heads_per_layer: List[int], ffn_size: int, seq_len: float) -> float:
+    """Multiply-accumulate FLOPs per sequence for the encoder layers"""
+    d, dh = config.hidden_size, config.hidden_size // config.num_attention_heads
+    total = 0.0
+    for heads in heads_per_layer:
+        inner = heads * dh
+        total += 2 * seq_len * 4 * d * inner          # Q, K, V and output projections
+        total += 2 * 2 * seq_len * seq_len * inner    # scores and weighted sum
+        total += 2 * seq_len * 2 * d * ffn_size       # FFN up and down projections
+    return total
+
+
+def plan_pruning(config, head_importance: torch.Tensor, ffn_importance: List[torch.Tensor], target: float, seq_len: float) -> Dict:
+    """
+    Greedy plan: repeatedly take the cheaper of (next least important head) and (next FFN step
+    in every layer), comparing the share of importance lost per share of FLOPs saved.
+    """
+    n_layers, n_heads = head_importance.shape
+    ffn_size = config.intermediate_size
+    step = max(1, ffn_size // FFN_STEPS)
+    heads_kept = [n_heads] * n_layers
+    full = encoder_flops(config, heads_kept, ffn_size, seq_len)
+    head_flop = (full - encoder_flops(config, [n_heads - 1] + [n_heads] * (n_layers - 1), ffn_size, seq_len))
+    ffn_step_flop = full - encoder_flops(config, heads_kept, ffn_size - step, seq_len)
+
+    head_total = float(head_importance.sum())
+    ffn_total = float(sum(imp.sum() for imp in ffn_importance))
+    head_order = sorted(((float(head_importance[l, h]), l, h) for l in range(n_layers) for h in range(n_heads)))
+    ffn_orders = [torch.argsort(imp).tolist() for imp in ffn_importance]  # ascending importance per layer
+
+    pruned_heads: Dict[int, List[int]] = {}
+    ffn_removed = 0
+    flops = full
+    while flops > full * (1 - target):
+        options = []
+        # Keep at least one head per layer
+        remaining = [entry for entry in head_order if heads_kept[entry[1]] > 1]
+        if remaining:
+            score, _, _ = remaining[0]
+            options.append(((score / head_total) / (head_flop / full), "head"))
+        if ffn_size - ffn_removed - step >= step:
+            step_importance = sum(
+                float(imp[order[ffn_removed:ffn_removed + step]].sum())
+                for imp, order in zip(ffn_importance, ffn_orders)
+            )
+            options.append(((step_importance / ffn_total) / (ffn_step_flop / full), "ffn"))
+        if not options:
+            break
+        _, kind = min(options)
+        if kind == "head":
+            _, layer, head = remaining[0]
+            head_order.remove(remaining[0])
+            pruned_heads.setdefault(layer, []).append(head)
+            heads_kept[layer] -= 1
+        else:
+            ffn_removed += step
+        flops = encoder_flops(config, heads_kept, ffn_size - ffn_removed, seq_len)
+
+    ffn_keep = [sorted(order[ffn_removed:]) for order in ffn_orders]
+    return {
+        "pruned_heads": {layer: sorted(heads) for layer, heads in pruned_heads.items()},
+        "ffn_keep": ffn_keep,
+        "heads_per_layer": heads_kept,
+        "intermediate_size": ffn_size - ffn_removed,
+        "flops_before": full,
+        "flops_after": flops,
+    }
+
+
+def apply_pruning(model, plan: Dict) -> None:
+    model.prune_heads(plan["pruned_heads"])  # also records config.pruned_heads
+    for layer, keep in zip(model.bert.encoder.layer, plan["ffn_keep"]):
+        index = torch.as_tensor(keep, dtype=torch.long)
+        layer.intermediate.dense = prune_linear_layer(layer.intermediate.dense, index, dim=0)
+        layer.output.dense = prune_linear_layer(layer.output.dense, index, dim=1)
+    model.config.intermediate_size = plan["intermediate_size"]
+
+
+def finetune(model, tokenizer, texts: List[str], labels: np.ndarray, epochs: int, lr: float, batch_size: int, seed: int) -> None:
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    rng = np.random.default_rng(seed)
+    model.train()
+    for epoch in range(epochs):
+        order = rng.permutation(len(texts))
+        shuffled = [texts[i] for i in order]
+        losses = []
+        for inputs, y in _batches(shuffled, labels[order], tokenizer, batch_size):
+            loss = model(**inputs, labels=y).loss
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            losses.append(loss.item())
+        print({"epoch": epoch + 1, "loss": round(statistics.mean(losses), 4)})
+    model.eval()
+
+
+def evaluate(model, tokenizer, texts: List[str], labels: np.ndarray, batch_size: int, latency_samples: int) -> Dict:
+    model.eval()
+    correct = top3 = 0
+    with torch.no_grad():
+        for inputs, y in _batches(texts, labels, tokenizer, batch_size):
+            logits = model(**inputs).logits
+            correct += int((logits.argmax(-1) == y).sum())
+            top3 += int((logits.topk(min(3, logits.shape[-1]), dim=-1).indices == y[:, None]).any(-1).sum())
+
+        # Single-request latency, as the API sees it
+        times = []
+        for text in texts[:latency_samples]:
+            inputs = tokenizer([text], truncation=True, padding=True, max_length=256, return_tensors="pt")
+            start = time.perf_counter()
+            model(**inputs)
+            times.append(time.perf_counter() - start)
+    return {
+        "accuracy": round(correct / len(texts), 4),
+        "top3_accuracy": round(top3 / len(texts), 4),
+        "latency_ms_p50": round(statistics.median(times) * 1000, 2),
+        "parameters": sum(p.numel() for p in model.parameters()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model_path", default="models/symptom_disease_model")
+    parser.add_argument("--output", default="models/optimized/symptom_model_pruned")
+    parser.add_argument("--flop_reduction", type=float, default=0.4, help="Target fraction of encoder FLOPs to remove")
+    parser.add_argument("--finetune_epochs", type=int, default=0, help="Recovery fine-tuning epochs (0 = none)")
+    parser.add_argument("--lr", type=float, default=2e-5)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--eval_fraction", type=float, default=0.2)
+    parser.add_argument("--latency_samples", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model_path):
+        print(f"❌ Model not found at {args.model_path}")
+        print("Please run download_model.py first or copy your trained model there")
+        return
+    torch.manual_seed(args.seed)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(args.model_path)
+    if model.config.model_type != "bert":
+        print(f"❌ Only BERT-style checkpoints are supported (got {model.config.model_type})")
+        return
+    train_x, train_y, eval_x, eval_y = load_data(args.model_path, args.eval_fraction, args.seed)
+    # Note: the eval split may overlap the data the checkpoint was fine-tuned on; compare before vs. after
+    before = evaluate(model, tokenizer, eval_x, eval_y, args.batch_size, args.latency_samples)
+    print({"before": before})
+
+    print("Scoring head and FFN importance...")
+    head_importance, ffn_importance = score_importance(model, tokenizer, train_x, train_y, args.batch_size)
+    seq_len = float(np.mean([len(ids) for ids in tokenizer(train_x, truncation=True, max_length=256)["input_ids"]]))
+    plan = plan_pruning(model.config, head_importance, ffn_importance, args.flop_reduction, seq_len)
+    apply_pruning(model, plan)
+    print({
+        "heads_per_layer": plan["heads_per_layer"],
+        "intermediate_size": plan["intermediate_size"],
+        "flop_reduction": round(1 - plan["flops_after"] / plan["flops_before"], 4),
+    })
+
+    if args.finetune_epochs:
+        finetune(model, tokenizer, train_x, train_y, args.finetune_epochs, args.lr, args.batch_size, args.seed)
+    after = evaluate(model, tokenizer, eval_x, eval_y, args.batch_size, args.latency_samples)
+    print({"after": after})
+
+    os.makedirs(args.output, exist_ok=True)
+    model.save_pretrained(args.output)
+    tokenizer.save_pretrained(args.output)
+    label_encoder_path = os.path.join(args.model_path, "label_encoder.pkl")
+    if os.path.exists(label_encoder_path):
+        shutil.copy2(label_encoder_path, args.output)
+
+    # Reload to make sure the saved checkpoint is loadable as-is
+    reloaded = AutoModelForSequenceClassification.from_pretrained(args.output).eval()
+    probe = tokenizer(eval_x[:4], truncation=True, padding=True, max_length=256, return_tensors="pt")
+    with torch.no_grad():
+        max_diff = float((reloaded(**probe).logits - model(**probe).logits).abs().max())
+
+    report = {
+        "source": args.model_path,
+        "flop_reduction_target": args.flop_reduction,
+        "flop_reduction": round(1 - plan["flops_after"] / plan["flops_before"], 4),
+        "mean_tokens": round(seq_len, 1),
+        "heads_per_layer": plan["heads_per_layer"],
+        "intermediate_size": plan["intermediate_size"],
+        "finetune_epochs": args.finetune_epochs,
+        "before": before,
+        "after": after,
+        "reload_max_logit_diff": max_diff,
+    }
+    with open(os.path.join(args.output, "prune_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Pruned model saved to {args.output} (report: prune_report.json)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Domain vocabulary pruning for the BioBERT symptom classifier
+- Tokenizes the training CSV and any production corpora (CSV/JSONL, read in blocks)
+- Keeps the tokens seen, the special tokens and every single-character piece (word-start and ##),
+  so unseen words still split into characters instead of becoming [UNK]
+- Slices the word-embedding matrix and rewrites vocab.txt / tokenizer.json with the same mapping
+- Checks tokenization and prediction parity against the original through BioBERTInferenceService
+
+WordPiece picks the longest matching piece at each position, so any text in the corpora
+tokenizes to exactly the same pieces with the pruned vocabulary.
+
+Example:
+    python prune_vocab.py --corpus data/Symptom2Disease.csv archive.jsonl --text_column Symptoms text
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+from typing import Dict, Iterable, List, Set
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from training.data_prep import read_blocks
+
+
+def corpus_texts(paths: List[str], text_columns: List[str], block_rows: int) -> Iterable[List[str]]:
+    """Blocks of texts from every corpus, using the first listed column each file has"""
+    for path in paths:
+        for block in read_blocks(path, block_rows):
+            column = next((c for c in text_columns if c in block.columns), None)
+            if column is None:
+                raise ValueError(f"{path} has none of the text columns {text_columns}")
+            yield block[column].dropna().astype(str).tolist()
+
+
+def seen_token_ids(tokenizer, blocks: Iterable[List[str]], sample: List[str], sample_size: int) -> Set[int]:
+    """Ids of every token in the corpora; fills ``sample`` with texts for the parity check"""
+    seen: Set[int] = set()
+    for texts in blocks:
+        for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]:
+            seen.update(ids)
+        # A few texts from each block, so later corpora are represented too
+        sample.extend(texts[:min(sample_size - len(sample), max(1, sample_size // 10))])
+    return seen
+
+
+def fallback_ids(vocab: Dict[str, int]) -> Set[int]:
+    """Single characters and their ## continuations"""
+    return {i for token, i in vocab.items() if len(token) == 1 or (token.startswith("##") and len(token) == 3)}
+
+
+def write_tokenizer(model_path: str, output: str, kept_tokens: List[str]) -> None:
+    """Copy the tokenizer files with every token id remapped to its position in ``kept_tokens``"""
+    new_ids = {token: i for i, token in enumerate(kept_tokens)}
+
+    with open(os.path.join(output, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(kept_tokens) + "\n")
+
+    with open(os.path.join(model_path, "tokenizer.json"), encoding="utf-8") as f:
+        spec = json.load(f)
+    spec["model"]["vocab"] = new_ids
+    for added in spec.get("added_tokens", []):
+        added["id"] = new_ids[added["content"]]
+    for special in (spec.get("post_processor") or {}).get("special_tokens", {}).values():
+        special["ids"] = [new_ids[token] for token in special["tokens"]]
+    with open(os.path.join(output, "tokenizer.json"), "w", encoding="utf-8") as f:
+        json.dump(spec, f, ensure_ascii=False, indent=2)
+
+    config_path = os.path.join(model_path, "tokenizer_config.json")
+    if os.path.exists(config_path):
+        with open(config_path, encoding="utf-8") as f:
+            tokenizer_config = json.load(f)
+        if "added_tokens_decoder" in tokenizer_config:
+            tokenizer_config["added_tokens_decoder"] = {
+                str(new_ids[entry["content"]]): entry for entry in tokenizer_config["added_tokens_decoder"].values()
+            }
+        with open(os.path.join(output, "tokenizer_config.json"), "w", encoding="utf-8") as f:
+            json.dump(tokenizer_config, f, ensure_ascii=False, indent=2)
+
+    special_map = os.path.join(model_path, "special_tokens_map.json")
+    if os.path.exists(special_map):
+        shutil.copy2(special_map, output)
+
+
+def prune_embeddings(model, keep: List[int], pad_token_id: int) -> None:
+    old = model.get_input_embeddings()
+    new = torch.nn.Embedding(len(keep), old.embedding_dim, padding_idx=pad_token_id)
+    new.weight.data.copy_(old.weight.data[torch.as_tensor(keep, dtype=torch.long)])
+    model.set_input_embeddings(new)
+    model.config.vocab_size = len(keep)
+    model.config.pad_token_id = pad_token_id
+
+
+def _dir_mb(path: str) -> float:
+    return round(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6, 1)
+
+
+def _load_service(path: str):
+    from app.services.biobert_infer import BioBERTInferenceService
+
+    start = time.perf_counter()
+    service = BioBERTInferenceService(model_path=path)
+    return service, round(time.perf_counter() - start, 2)
+
+
+def check_parity(model_path: str, output: str, texts: List[str], old_to_new: np.ndarray, batch_size: int) -> Dict:
+    """Token ids and top-k predictions of the pruned model against the original, through the serving path"""
+    original, _ = _load_service(model_path)  # the first load also pays one-off imports
+    pruned, pruned_load_s = _load_service(output)
+    _, original_load_s = _load_service(model_path)
+
+    old_ids = original.tokenizer(texts)["input_ids"]
+    new_ids = pruned.tokenizer(texts)["input_ids"]
+    token_mismatches = sum(old_to_new[old].tolist() != new for old, new in zip(old_ids, new_ids))
+
+    label_mismatches, max_prob_diff = 0, 0.0
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        old_probs, old_idx = original.topk(batch)
+        new_probs, new_idx = pruned.topk(batch)
+        label_mismatches += int((old_idx[:, 0] != new_idx[:, 0]).sum())
+        max_prob_diff = max(max_prob_diff, float(np.abs(old_probs - new_probs).max()))
+
+    return {
+        "texts": len(texts),
+        "token_mismatches": token_mismatches,
+        "top1_mismatches": label_mismatches,
+        "max_prob_diff": max_prob_diff,
+        "load_seconds_before": original_load_s,
+        "load_seconds_after": pruned_load_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model_path", default="models/symptom_disease_model")
+    parser.add_argument("--output", default="models/optimized/symptom_model_vocab")
+    parser.add_argument("--corpus", nargs="+", default=["data/Symptom2Disease.csv"],
+                        help="Training and production corpora (CSV or JSONL)")
+    parser.add_argument("--text_column", nargs="+", default=["Symptoms", "text"],
+                        help="Text column(s); the first one present in each file is used")
+    parser.add_argument("--block_rows", type=int, default=5000)
+    parser.add_argument("--parity_samples", type=int, default=500, help="Corpus texts used for the parity check")
+    parser.add_argument("--batch_size", type=int, default=32)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model_path):
+        print(f"❌ Model not found at {args.model_path}")
+        print("Please run download_model.py first or copy your trained model there")
+        return
+    missing = [path for path in args.corpus if not os.path.exists(path)]
+    if missing:
+        print(f"❌ Corpus not found: {', '.join(missing)}")
+        return
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    if not tokenizer.is_fast or not os.path.exists(os.path.join(args.model_path, "tokenizer.json")):
+        print("❌ A fast (tokenizer.json) WordPiece tokenizer is required")
+        return
+    vocab = tokenizer.get_vocab()
+
+    print("Tokenizing corpora...")
+    sample: List[str] = []
+    seen = seen_token_ids(tokenizer, corpus_texts(args.corpus, args.text_column, args.block_rows), sample, args.parity_samples)
+    keep_ids = sorted(seen | set(tokenizer.all_special_ids) | fallback_ids(vocab))
+    id_to_token = {i: token for token, i in vocab.items()}
+    kept_tokens = [id_to_token[i] for i in keep_ids]
+    old_to_new = np.full(len(vocab), -1, dtype=np.int64)
+    old_to_new[keep_ids] = np.arange(len(keep_ids))
+    print({"vocab_before": len(vocab), "seen": len(seen), "vocab_after": len(keep_ids)})
+
+    model = AutoModelForSequenceClassification.from_pretrained(args.model_path)
+    embedding_params_before = model.get_input_embeddings().weight.numel()
+    prune_embeddings(model, keep_ids, int(old_to_new[tokenizer.pad_token_id]))
+
+    os.makedirs(args.output, exist_ok=True)
+    model.save_pretrained(args.output)
+    write_tokenizer(args.model_path, args.output, kept_tokens)
+    label_encoder_path = os.path.join(args.model_path, "label_encoder.pkl")
+    if os.path.exists(label_encoder_path):
+        shutil.copy2(label_encoder_path, args.output)
+
+    parity = check_parity(args.model_path, args.output, sample, old_to_new, args.batch_size)
+    report = {
+        "source": args.model_path,
+        "corpora": args.corpus,
+        "vocab_before": len(vocab),
+        "vocab_after": len(keep_ids),
+        "embedding_params_before": embedding_params_before,
+        "embedding_params_after": model.get_input_embeddings().weight.numel(),
+        "size_mb_before": _dir_mb(args.model_path),
+        "size_mb_after": _dir_mb(args.output),
+        "parity": parity,
+    }
+    with open(os.path.join(args.output, "vocab_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(report)
+
+    if parity["token_mismatches"] or parity["top1_mismatches"] or parity["max_prob_diff"] > 1e-4:
+        print(f"❌ Parity check failed; see {os.path.join(args.output, 'vocab_report.json')}")
+        return
+    print(f"✅ Pruned-vocabulary model saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
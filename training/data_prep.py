@@ -1,31 +1,60 @@
 import re
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
 import pandas as pd
 
 
+# Simple synonym normalization examples (applied after punctuation/whitespace cleanup)
+SYNONYMS: Dict[str, str] = {
+    "loose motions": "diarrhea",
+    "gas": "bloating",
+    "acidity": "heartburn",
+}
+
+
+def _synonym_pattern(synonyms: Dict[str, str]) -> "re.Pattern":
+    # Longest keys first so multi-word phrases win over their substrings
+    return re.compile("|".join(re.escape(k) for k in sorted(synonyms, key=len, reverse=True)))
+
+
+_SYNONYM_PATTERN = _synonym_pattern(SYNONYMS)
+
+
 def _normalize_text(text: str) -> str:
     t = str(text).lower()
     t = re.sub(r"[^a-z0-9\s]", " ", t)
     t = re.sub(r"\s+", " ", t).strip()
-    # Simple synonym normalization examples
-    t = t.replace("loose motions", "diarrhea")
-    t = t.replace("gas", "bloating")
-    t = t.replace("acidity", "heartburn")
-    return t
+    return _SYNONYM_PATTERN.sub(lambda m: SYNONYMS[m.group(0)], t)
 
 
-def load_and_merge(csv_paths: List[str], label_column: str = "label", text_column: str = "text") -> pd.DataFrame:
+def normalize_series(texts: pd.Series, synonyms: Optional[Dict[str, str]] = None) -> pd.Series:
+    """Vectorized _normalize_text: pandas string ops plus one compiled synonym pass"""
+    synonyms = synonyms or SYNONYMS
+    pattern = _SYNONYM_PATTERN if synonyms is SYNONYMS else _synonym_pattern(synonyms)
+    t = texts.astype(str).str.lower()
+    t = t.str.replace(r"[^a-z0-9\s]", " ", regex=True)
+    t = t.str.replace(r"\s+", " ", regex=True).str.strip()
+    return t.str.replace(pattern, lambda m: synonyms[m.group(0)], regex=True)
+
+
+def load_and_merge(
+    csv_paths: List[str],
+    label_column: str = "label",
+    text_column: str = "text",
+    chunksize: Optional[int] = None,
+) -> pd.DataFrame:
     frames: List[pd.DataFrame] = []
     for path in csv_paths:
-        df = pd.read_csv(path)
-        if text_column not in df.columns or label_column not in df.columns:
-            raise ValueError(f"File {path} must contain columns: {text_column}, {label_column}")
-        frames.append(df[[text_column, label_column] + [c for c in df.columns if c not in {text_column, label_column}]].copy())
+        # With chunksize, large CSVs are read and normalized piecewise
+        chunks = pd.read_csv(path, chunksize=chunksize) if chunksize else [pd.read_csv(path)]
+        for df in chunks:
+            if text_column not in df.columns or label_column not in df.columns:
+                raise ValueError(f"File {path} must contain columns: {text_column}, {label_column}")
+            df = df[[text_column, label_column] + [c for c in df.columns if c not in {text_column, label_column}]].copy()
+            # Normalize text
+            df[text_column] = normalize_series(df[text_column])
+            frames.append(df)
     merged = pd.concat(frames, ignore_index=True)
 
-    # Normalize text
-    merged[text_column] = merged[text_column].astype(str).map(_normalize_text)
-
     # Optional structured features
     # If present, we will pass these through to the model builder
     for opt in ["severity", "rural", "gender", "age"]:
@@ -37,3 +66,19 @@ def load_and_merge(csv_paths: List[str], label_column: str = "label", text_colum
                 merged[opt] = merged[opt].astype(str).str.lower()
 
     return merged
+
+
+def read_blocks(path: str, block_rows: int, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield the input in blocks of rows, starting after ``skip_rows`` records"""
+    if path.endswith((".jsonl", ".ndjson")):
+        reader = pd.read_json(path, lines=True, chunksize=block_rows)
+    else:
+        reader = pd.read_csv(path, chunksize=block_rows)
+    seen = 0
+    for block in reader:
+        start, seen = seen, seen + len(block)
+        if seen <= skip_rows:
+            continue
+        if start < skip_rows:
+            block = block.iloc[skip_rows - start:]
+        yield block
@@ -0,0 +1,179 @@
+"""
+Sharded, multi-process PubMedBERT embedding for large training corpora.
+
+The merged corpus is split into fixed-size row shards. N worker processes (each with
+a pinned torch thread count) embed shards independently and write them as .npy files,
+which np.load(..., mmap_mode="r") can memory-map. Finished shards are skipped on rerun,
+so a killed job resumes where it stopped. The merge step concatenates the shards into a
+single embeddings.npy that train.py --embeddings reads instead of re-embedding.
+"""
+
+import os
+import json
+import argparse
+import hashlib
+import multiprocessing as mp
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from training.data_prep import load_and_merge
+
+
+MANIFEST = "manifest.json"
+MERGED = "embeddings.npy"
+MERGED_LABELS = "labels.npy"
+
+_embedder = None
+
+
+def _shard_path(out_dir: str, shard_id: int, suffix: str = "emb") -> str:
+    return os.path.join(out_dir, f"shard_{shard_id:05d}.{suffix}.npy")
+
+
+def _atomic_save(path: str, array: np.ndarray) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _fingerprint(csv_paths: List[str], rows: int, shard_rows: int, max_length: int) -> str:
+    h = hashlib.sha256()
+    for path in csv_paths:
+        stat = os.stat(path)
+        h.update(f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    h.update(f"{rows}:{shard_rows}:{max_length}".encode())
+    return h.hexdigest()
+
+
+def _init_worker(threads: int) -> None:
+    global _embedder
+    import torch
+    from app.transformers.embedder import PubMedBERTEmbedder
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _embedder = PubMedBERTEmbedder()
+
+
+def _embed_shard(task: Tuple[int, List[str], List[str], str, int, int]) -> int:
+    shard_id, texts, labels, out_dir, batch_size, max_length = task
+    parts = [
+        _embedder.embed_texts(texts[i:i + batch_size], max_length=max_length)
+        for i in range(0, len(texts), batch_size)
+    ]
+    # Labels first: a shard counts as done only once its embedding file exists
+    _atomic_save(_shard_path(out_dir, shard_id, "labels"), np.array(labels, dtype=str))
+    _atomic_save(_shard_path(out_dir, shard_id), np.concatenate(parts).astype(np.float32))
+    return shard_id
+
+
+def embed_shards(
+    csv_paths: List[str],
+    out_dir: str,
+    workers: int = 2,
+    threads_per_worker: Optional[int] = None,
+    shard_rows: int = 10000,
+    batch_size: int = 64,
+    max_length: int = 128,
+) -> Dict:
+    os.makedirs(out_dir, exist_ok=True)
+    df = load_and_merge(csv_paths, label_column="label", text_column="text")
+    texts = df["text"].astype(str).tolist()
+    labels = df["label"].astype(str).tolist()
+    num_shards = (len(df) + shard_rows - 1) // shard_rows
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    fingerprint = _fingerprint(csv_paths, len(df), shard_rows, max_length)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous.get("fingerprint") != fingerprint:
+            raise RuntimeError(
+                f"{out_dir} holds shards for different inputs or settings; use a new --out directory"
+            )
+    manifest = {
+        "fingerprint": fingerprint,
+        "inputs": [os.path.abspath(p) for p in csv_paths],
+        "rows": len(df),
+        "shard_rows": shard_rows,
+        "num_shards": num_shards,
+        "max_length": max_length,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    pending = [s for s in range(num_shards) if not os.path.exists(_shard_path(out_dir, s))]
+    print({"rows": len(df), "shards": num_shards, "pending": len(pending), "workers": workers, "threads_per_worker": threads})
+    tasks = (
+        (s, texts[s * shard_rows:(s + 1) * shard_rows], labels[s * shard_rows:(s + 1) * shard_rows], out_dir, batch_size, max_length)
+        for s in pending
+    )
+    if pending:
+        # spawn: forked children inheriting an initialized torch runtime can deadlock
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+            for done, shard_id in enumerate(pool.imap_unordered(_embed_shard, tasks), 1):
+                print(f"shard {shard_id} done ({done}/{len(pending)})")
+    return manifest
+
+
+def merge_shards(out_dir: str) -> str:
+    """Concatenate shard files into one memory-mappable embeddings.npy (+ labels.npy)"""
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    missing = [s for s in range(manifest["num_shards"]) if not os.path.exists(_shard_path(out_dir, s))]
+    if missing:
+        raise RuntimeError(f"{len(missing)} shards not embedded yet (first: {missing[0]}); rerun embedding to resume")
+
+    first = np.load(_shard_path(out_dir, 0), mmap_mode="r")
+    merged_path = os.path.join(out_dir, MERGED)
+    tmp = f"{merged_path}.tmp"
+    merged = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(manifest["rows"], first.shape[1]))
+    labels = []
+    offset = 0
+    for s in range(manifest["num_shards"]):
+        shard = np.load(_shard_path(out_dir, s), mmap_mode="r")
+        merged[offset:offset + len(shard)] = shard
+        offset += len(shard)
+        labels.append(np.load(_shard_path(out_dir, s, "labels")))
+    merged.flush()
+    del merged
+    os.replace(tmp, merged_path)
+    _atomic_save(os.path.join(out_dir, MERGED_LABELS), np.concatenate(labels))
+    print(f"Merged {manifest['num_shards']} shards ({offset} rows) into {merged_path}")
+    return merged_path
+
+
+def load_merged_embeddings(out_dir: str, expected_rows: Optional[int] = None) -> np.ndarray:
+    """Memory-map merged embeddings; rows align with load_and_merge() over the same inputs"""
+    embeddings = np.load(os.path.join(out_dir, MERGED), mmap_mode="r")
+    if expected_rows is not None and len(embeddings) != expected_rows:
+        raise RuntimeError(f"{out_dir} has {len(embeddings)} embedded rows but the data has {expected_rows}")
+    return embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded multi-process text embedding")
+    parser.add_argument("--data", nargs="+", required=True, help="One or more CSV paths (text,label)")
+    parser.add_argument("--out", required=True, help="Shard output directory")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads_per_worker", type=int, default=None, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--shard_rows", type=int, default=10000)
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--max_length", type=int, default=128)
+    parser.add_argument("--no_merge", action="store_true", help="Only embed shards")
+    args = parser.parse_args()
+
+    embed_shards(
+        args.data,
+        args.out,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        shard_rows=args.shard_rows,
+        batch_size=args.batch_size,
+        max_length=args.max_length,
+    )
+    if not args.no_merge:
+        merge_shards(args.out)
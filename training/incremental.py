@@ -0,0 +1,252 @@
+"""
+Out-of-core incremental classifier training over embedding shards.
+
+Shards written by training/embed_shards.py are memory-mapped and fed to an
+SGDClassifier (logistic loss) in fixed-size chunks via partial_fit, so RAM use
+is bounded by --chunk_rows rather than the corpus size. With --warm_start the
+current artifacts/classifier.joblib is continued on shards it has not seen yet,
+so appending new labelled cases costs time proportional to the new data.
+A LogisticRegression from train.py is converted to a warm SGD starting point.
+
+Only text embeddings are used (no structured features), matching InferenceService.
+"""
+
+import os
+import json
+import argparse
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import joblib
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, top_k_accuracy_score
+
+from training.embed_shards import MANIFEST, _shard_path
+
+
+STATE = "incremental_state.json"
+# Step-size schedule position assumed for a converted LogisticRegression, so the
+# first updates refine its weights instead of overwriting them
+_CONVERTED_SAMPLES_SEEN = 10000
+# Log-odds given to labels a converted classifier never saw
+_UNSEEN_INTERCEPT = float(np.log(1e-4))
+_MIN_CONVERSION_AGREEMENT = 0.99
+
+
+def _shards(shard_dirs: List[str]) -> List[Tuple[str, str, str]]:
+    """(key, embeddings path, labels path) for every finished shard"""
+    found = []
+    for shard_dir in shard_dirs:
+        with open(os.path.join(shard_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        for s in range(manifest["num_shards"]):
+            emb = _shard_path(shard_dir, s)
+            if not os.path.exists(emb):
+                raise RuntimeError(f"Shard {emb} missing; finish training/embed_shards.py first")
+            found.append((f"{manifest['fingerprint']}:{s}", emb, _shard_path(shard_dir, s, "labels")))
+    return found
+
+
+def iter_chunks(shards: List[Tuple[str, str, str]], chunk_rows: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    for _, emb_path, labels_path in shards:
+        embeddings = np.load(emb_path, mmap_mode="r")
+        labels = np.load(labels_path)
+        for start in range(0, len(labels), chunk_rows):
+            yield np.asarray(embeddings[start:start + chunk_rows], dtype=np.float64), labels[start:start + chunk_rows]
+
+
+def _load_state(artifacts_dir: str) -> Dict:
+    path = os.path.join(artifacts_dir, STATE)
+    if not os.path.exists(path):
+        return {"trained_shards": [], "samples_seen": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _ovr_weights(clf, n_labels: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One-vs-rest (coef, intercept) with a row per label for a fitted linear classifier.
+
+    A multinomial model's log-odds of class k against the rest are approximated by
+    z_k - mean_{j!=k} z_j - log(K-1), which is linear in the inputs and keeps the
+    argmax; probabilities come out flatter than the softmax ones (reported by the
+    round trip in _warm_classifier) and sharpen again as partial_fit continues.
+    Labels the model never saw (absent from its training split) get zero weights
+    and a low prior, so partial_fit can still learn them.
+    """
+    coef = np.asarray(clf.coef_, dtype=np.float64)
+    intercept = np.asarray(clf.intercept_, dtype=np.float64)
+    classes = np.asarray(clf.classes_)
+    k = len(classes)
+    if coef.shape[0] == 1:
+        if n_labels == 2:
+            return coef, intercept  # binary in both models: the same decision function
+        # One decision function for classes_[1] against classes_[0]
+        coef, intercept = np.vstack([-coef, coef]), np.concatenate([-intercept, intercept])
+    elif not isinstance(clf, SGDClassifier) and getattr(clf, "multi_class", "auto") != "ovr":
+        coef = (k * coef - coef.sum(axis=0)) / (k - 1)
+        intercept = (k * intercept - intercept.sum()) / (k - 1) - np.log(k - 1)
+
+    full_coef = np.zeros((n_labels, coef.shape[1]))
+    full_intercept = np.full(n_labels, _UNSEEN_INTERCEPT)
+    full_coef[classes] = coef
+    full_intercept[classes] = intercept
+    return full_coef, full_intercept
+
+
+def _warm_classifier(
+    artifacts_dir: str, state: Dict, alpha: float, sample: np.ndarray
+) -> Tuple[SGDClassifier, List[str]]:
+    """
+    The saved classifier as an SGDClassifier over text embeddings; ``sample`` is a chunk of
+    shard embeddings used to check the feature count and the conversion.
+    """
+    clf = joblib.load(os.path.join(artifacts_dir, "classifier.joblib"))
+    labels = list(joblib.load(os.path.join(artifacts_dir, "labels.joblib")))
+    if not hasattr(clf, "coef_"):
+        raise RuntimeError(f"Cannot warm-start from {type(clf).__name__}; retrain without --warm_start")
+    n_features = np.asarray(clf.coef_).shape[1]
+    if n_features != sample.shape[1]:
+        raise RuntimeError(
+            f"Classifier expects {n_features} features but the shards have {sample.shape[1]} "
+            "(train.py appends structured features when the data has severity/age/gender/rural); "
+            "retrain without --warm_start"
+        )
+    classes = np.asarray(clf.classes_)
+    if not np.issubdtype(classes.dtype, np.integer) or classes.min() < 0 or classes.max() >= len(labels):
+        raise RuntimeError(f"Classifier classes {classes.tolist()[:5]}... do not index labels.joblib; retrain without --warm_start")
+    if isinstance(clf, SGDClassifier) and len(classes) == len(labels):
+        return clf, labels
+
+    sgd = SGDClassifier(loss="log_loss", alpha=alpha)
+    sgd.classes_ = np.arange(len(labels))
+    sgd.coef_, sgd.intercept_ = _ovr_weights(clf, len(labels))
+    sgd.n_features_in_ = n_features
+    sgd.t_ = float(state.get("samples_seen") or _CONVERTED_SAMPLES_SEEN)
+
+    # Round trip: before any update the converted model should rank like the original
+    original = clf.predict_proba(sample)
+    converted = sgd.predict_proba(sample)[:, classes]
+    agreement = float(np.mean(original.argmax(axis=1) == converted.argmax(axis=1)))
+    print({
+        "converted": type(clf).__name__,
+        "classes": f"{len(classes)}/{len(labels)}",
+        "top1_agreement": round(agreement, 4),
+        "mean_abs_prob_diff": round(float(np.abs(original - converted).mean()), 4),
+    })
+    if agreement < _MIN_CONVERSION_AGREEMENT:
+        raise RuntimeError(
+            f"Converted classifier agrees with the original on only {agreement:.1%} of a shard sample; "
+            "retrain without --warm_start"
+        )
+    return sgd, labels
+
+
+def _balanced_weights(shards: List[Tuple[str, str, str]], label_index: Dict[str, int]) -> np.ndarray:
+    """Same weighting as class_weight="balanced", computed from label files only"""
+    counts = np.zeros(len(label_index))
+    for _, _, labels_path in shards:
+        values, n = np.unique(np.load(labels_path), return_counts=True)
+        for value, count in zip(values, n):
+            counts[label_index[value]] += count
+    return counts.sum() / (len(counts) * np.maximum(counts, 1))
+
+
+def evaluate(clf: SGDClassifier, shards: List[Tuple[str, str, str]], label_index: Dict[str, int], chunk_rows: int) -> Dict:
+    y_true, y_pred, probas = [], [], []
+    for X, labels in iter_chunks(shards, chunk_rows):
+        known = np.array([label in label_index for label in labels])
+        if not known.any():
+            continue
+        y_true.append(np.array([label_index[label] for label in labels[known]]))
+        probas.append(clf.predict_proba(X[known]))
+        y_pred.append(probas[-1].argmax(axis=1))
+    if not y_true:
+        return {"rows": 0, "accuracy": None, "top3": None}
+    y_true, y_pred, probas = np.concatenate(y_true), np.concatenate(y_pred), np.concatenate(probas)
+    k = min(3, len(label_index))
+    return {
+        "rows": len(y_true),
+        "accuracy": accuracy_score(y_true, y_pred),
+        "top3": top_k_accuracy_score(y_true, probas, k=k, labels=list(range(len(label_index)))),
+    }
+
+
+def stream_train(
+    shard_dirs: List[str],
+    artifacts_dir: str,
+    warm_start: bool = False,
+    chunk_rows: int = 4096,
+    epochs: int = 1,
+    alpha: float = 1e-4,
+    eval_dirs: Optional[List[str]] = None,
+) -> None:
+    os.makedirs(artifacts_dir, exist_ok=True)
+    if warm_start and not os.path.exists(os.path.join(artifacts_dir, "classifier.joblib")):
+        print(f"No classifier in {artifacts_dir} to warm-start from; training from scratch")
+        warm_start = False
+    state = _load_state(artifacts_dir) if warm_start else {"trained_shards": [], "samples_seen": 0}
+    seen: Set[str] = set(state["trained_shards"])
+    shards = [s for s in _shards(shard_dirs) if s[0] not in seen]
+    if not shards:
+        print("No new shards to train on")
+        return
+
+    new_labels = sorted({str(label) for _, _, path in shards for label in np.unique(np.load(path))})
+    if warm_start:
+        sample, _ = next(iter_chunks(shards, chunk_rows))
+        clf, labels = _warm_classifier(artifacts_dir, state, alpha, sample)
+        unknown = sorted(set(new_labels) - set(labels))
+        if unknown:
+            raise RuntimeError(f"New labels {unknown} are not in the current model; retrain without --warm_start")
+    else:
+        clf, labels = SGDClassifier(loss="log_loss", alpha=alpha), new_labels
+
+    label_index = {label: i for i, label in enumerate(labels)}
+    classes = np.arange(len(labels))
+    class_weights = _balanced_weights(shards, label_index)
+
+    rows = 0
+    for epoch in range(epochs):
+        for X, chunk_labels in iter_chunks(shards, chunk_rows):
+            y = np.array([label_index[label] for label in chunk_labels])
+            clf.partial_fit(X, y, classes=classes, sample_weight=class_weights[y])
+            rows += len(y)
+        print({"epoch": epoch + 1, "rows": rows, "new_shards": len(shards)})
+
+    if eval_dirs:
+        print(evaluate(clf, _shards(eval_dirs), label_index, chunk_rows))
+
+    # Write to temp names then rename, so a watching ModelRegistry never sees half-written files
+    for name, obj in (("classifier.joblib", clf), ("labels.joblib", labels)):
+        tmp = os.path.join(artifacts_dir, f".{name}.tmp")
+        joblib.dump(obj, tmp)
+        os.replace(tmp, os.path.join(artifacts_dir, name))
+    state = {
+        "trained_shards": sorted(seen | {key for key, _, _ in shards}),
+        "samples_seen": int(state.get("samples_seen", 0)) + rows,
+    }
+    with open(os.path.join(artifacts_dir, STATE), "w") as f:
+        json.dump(state, f, indent=2)
+    print(f"Saved artifacts to {artifacts_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming classifier training over embedding shards")
+    parser.add_argument("--shards", nargs="+", required=True, help="Shard directories from training/embed_shards.py")
+    parser.add_argument("--artifacts", default=os.path.join("artifacts"))
+    parser.add_argument("--warm_start", action="store_true", help="Continue the current classifier on unseen shards only")
+    parser.add_argument("--chunk_rows", type=int, default=4096)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--alpha", type=float, default=1e-4, help="L2 regularization strength")
+    parser.add_argument("--eval", nargs="*", default=None, help="Shard directories to evaluate on")
+    args = parser.parse_args()
+
+    stream_train(
+        args.shards,
+        args.artifacts,
+        warm_start=args.warm_start,
+        chunk_rows=args.chunk_rows,
+        epochs=args.epochs,
+        alpha=args.alpha,
+        eval_dirs=args.eval,
+    )
@@ -1,6 +1,7 @@
 import os
 import argparse
 import joblib
+from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LogisticRegression
@@ -10,6 +11,7 @@ from sklearn.metrics import accuracy_score, top_k_accuracy_score, classification
 
 from app.transformers.embedder import PubMedBERTEmbedder
 from training.data_prep import load_and_merge
+from training.embed_shards import load_merged_embeddings
 
 
 STRUCT_FEATURES = ["severity", "rural", "gender", "age"]
@@ -35,63 +37,77 @@ def build_structured_features(df: pd.DataFrame) -> np.ndarray:
     return np.concatenate([numeric_arr, cat_arr], axis=1)
 
 
+def _evaluate_fold(X: np.ndarray, y: np.ndarray, train_idx: np.ndarray, test_idx: np.ndarray, n_classes: int):
+    clf = LogisticRegression(max_iter=300, class_weight="balanced", n_jobs=1)
+    clf.fit(X[train_idx], y[train_idx])
+
+    y_te = y[test_idx]
+    y_pred = clf.predict(X[test_idx])
+    acc = accuracy_score(y_te, y_pred)
+    k = min(3, n_classes)
+    try:
+        topk = top_k_accuracy_score(y_te, clf.predict_proba(X[test_idx]), k=k, labels=list(range(n_classes)))
+    except Exception:
+        topk = acc
+    return acc, topk
+
+
 def train_eval(
-    train_paths, artifacts_dir: str, test_path: str = None, kfolds: int = 0
+    train_paths,
+    artifacts_dir: str,
+    test_path: str = None,
+    kfolds: int = 0,
+    embeddings_dir: str = None,
+    n_jobs: int = -1,
+    chunksize: int = None,
 ) -> None:
     os.makedirs(artifacts_dir, exist_ok=True)
 
-    df = load_and_merge(train_paths, label_column="label", text_column="text")
+    df = load_and_merge(train_paths, label_column="label", text_column="text", chunksize=chunksize)
 
-    texts = df["text"].astype(str).tolist()
     labels = df["label"].astype(str).tolist()
 
     label_encoder = LabelEncoder()
     y = label_encoder.fit_transform(labels)
 
-    embedder = PubMedBERTEmbedder.get_instance()
+    # Precomputed by training/embed_shards.py over the same inputs; rows follow df's index
+    text_matrix = load_merged_embeddings(embeddings_dir, expected_rows=len(df)) if embeddings_dir else None
 
-    def embed_dataframe(sub_df: pd.DataFrame) -> np.ndarray:
-        text_emb = embedder.embed_texts(sub_df["text"].astype(str).tolist())
+    def embed_dataframe(sub_df: pd.DataFrame, precomputed: bool = True) -> np.ndarray:
+        if text_matrix is not None and precomputed:
+            text_emb = np.asarray(text_matrix[sub_df.index.to_numpy()])
+        else:
+            text_emb = PubMedBERTEmbedder.get_instance().embed_texts(sub_df["text"].astype(str).tolist())
         struct_emb = build_structured_features(sub_df)
         if struct_emb.shape[1] == 0:
             return text_emb
         return np.concatenate([text_emb, struct_emb], axis=1)
 
+    # Embed once; CV folds and the holdout split all slice this matrix
+    X_all = embed_dataframe(df)
+
     if kfolds and kfolds > 1 and len(np.unique(y)) > 1:
         skf = StratifiedKFold(n_splits=kfolds, shuffle=True, random_state=42)
-        accs, topks = [], []
-        for train_idx, test_idx in skf.split(np.arange(len(df)), y):
-            df_tr = df.iloc[train_idx]
-            df_te = df.iloc[test_idx]
-            X_tr = embed_dataframe(df_tr)
-            X_te = embed_dataframe(df_te)
-            y_tr = label_encoder.transform(df_tr["label"].astype(str).tolist())
-            y_te = label_encoder.transform(df_te["label"].astype(str).tolist())
-
-            clf = LogisticRegression(max_iter=300, class_weight="balanced", n_jobs=1)
-            clf.fit(X_tr, y_tr)
-
-            y_pred = clf.predict(X_te)
-            acc = accuracy_score(y_te, y_pred)
-            k = min(3, len(label_encoder.classes_))
-            try:
-                topk = top_k_accuracy_score(y_te, clf.predict_proba(X_te), k=k, labels=list(range(len(label_encoder.classes_))))
-            except Exception:
-                topk = acc
-            accs.append(acc)
-            topks.append(topk)
+        # loky workers memory-map X_all instead of copying it into every process
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_evaluate_fold)(X_all, y, train_idx, test_idx, len(label_encoder.classes_))
+            for train_idx, test_idx in skf.split(np.arange(len(df)), y)
+        )
+        accs, topks = zip(*results)
         print({"cv_accuracy_mean": float(np.mean(accs)), "cv_top3_mean": float(np.mean(topks))})
 
     # Holdout or provided test
-    if test_path and os.path.exists(test_path):
+    external_test = bool(test_path and os.path.exists(test_path))
+    if external_test:
         df_train = df
         df_test = load_and_merge([test_path], label_column="label", text_column="text")
+        X_test = embed_dataframe(df_test, precomputed=False)
     else:
         # Use a robust split without stratify for minimal data
         df_train, df_test = train_test_split(df, test_size=0.2, random_state=42)
+        X_test = X_all[df_test.index.to_numpy()]
 
-    X_train = embed_dataframe(df_train)
-    X_test = embed_dataframe(df_test)
+    X_train = X_all[df_train.index.to_numpy()]
 
     y_train = label_encoder.transform(df_train["label"].astype(str).tolist())
     y_test = label_encoder.transform(df_test["label"].astype(str).tolist())
@@ -129,6 +145,17 @@ if __name__ == "__main__":
     parser.add_argument("--test_data", default=None, help="Optional separate test CSV")
     parser.add_argument("--artifacts", default=os.path.join("artifacts"))
     parser.add_argument("--kfolds", type=int, default=0, help="K-fold CV folds (0 or 1 to skip)")
+    parser.add_argument("--embeddings", default=None, help="Merged shard directory from training/embed_shards.py (same --data)")
+    parser.add_argument("--n_jobs", type=int, default=-1, help="Parallel CV folds (-1 = all cores)")
+    parser.add_argument("--chunksize", type=int, default=None, help="Read and normalize CSVs in chunks of this many rows")
     args = parser.parse_args()
 
-    train_eval(args.data, args.artifacts, test_path=args.test_data, kfolds=args.kfolds)
+    train_eval(
+        args.data,
+        args.artifacts,
+        test_path=args.test_data,
+        kfolds=args.kfolds,
+        embeddings_dir=args.embeddings,
+        n_jobs=args.n_jobs,
+        chunksize=args.chunksize,
+    )